@@ -0,0 +1,5 @@
+# asgi.py
+# Entrypoint for production ASGI servers, e.g. `uvicorn asgi:app --host 0.0.0.0 --port 5000`
+from main import app
+
+__all__ = ["app"]
@@ -1,39 +1,58 @@
 # llm_providers/anthropic_provider.py
-from anthropic import Anthropic, APIError, AuthenticationError
-from .base_provider import BaseLLMProvider
-from typing import Dict, Any, List
+import time
+from operator import itemgetter
+from anthropic import Anthropic, AsyncAnthropic, APIError, AuthenticationError, NotFoundError, APIConnectionError, InternalServerError, OverloadedError, RateLimitError
+from .base_provider import BaseLLMProvider, ProviderAuthenticationError, ProviderRateLimitError, ProviderTransientError
+from .cache import cached_response, ttl_cache
+from .retry import retry_after_seconds, retry_on_transient
+from .http import get_shared_http_client, get_shared_sync_http_client
+from .key_rotation import KeyRotator, normalize_api_keys
+from typing import Dict, Any, List, Iterator, AsyncIterator, Optional, Union
 
 # Anthropic API Constants
 DEFAULT_ANTHROPIC_MODEL = "claude-3-sonnet-20240229"
 DEFAULT_MAX_TOKENS = 2048
+ANTHROPIC_KEY_PREFIX = "sk-ant-"
+# Maps incoming roles to Anthropic roles ('model' is Gemini's name for 'assistant')
+ANTHROPIC_ROLE_MAP = {"user": "user", "assistant": "assistant", "model": "assistant"}
+# Marks the end of a prompt prefix that Anthropic should cache between requests
+CACHE_CONTROL_EPHEMERAL = {"type": "ephemeral"}
+# The system prompt is shared by every chat from the panel, so it is kept for an hour
+# (instead of the default 5 minutes); longer-lived breakpoints must come first
+CACHE_CONTROL_EPHEMERAL_1H = {"type": "ephemeral", "ttl": "1h"}
+
+
+def _with_cache_control(content: Any) -> List[Dict[str, Any]]:
+    """Returns message content as a list of blocks whose last block carries a cache breakpoint."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL_EPHEMERAL}]
+    blocks = list(content)
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL_EPHEMERAL}
+    return blocks
 
 class AnthropicProvider(BaseLLMProvider):
     """
     LLM provider implementation for Anthropic (Claude) models.
     """
-    def __init__(self, api_key: str):
-        if not api_key:
-            raise ValueError("Anthropic API key is required.")
-        self.api_key = api_key
-        self.client = Anthropic(api_key=api_key)
-
-    def generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> str:
+    def __init__(self, api_key: Union[str, List[str]]):
         """
-        Generates a response using the Anthropic API.
-
         Args:
-            messages: List of message dictionaries (must have 'role' and 'content').
-                      Roles 'user' and 'assistant' are expected. 'system' messages
-                      will be handled separately.
-            options: Dictionary of options, must include 'model'. Can also include
-                     'temperature', 'max_tokens', etc.
-
-        Returns:
-            The LLM's response text.
-
-        Raises:
-            ValueError: If required options are missing or API call fails.
+            api_key: An Anthropic API key, or a list of keys to round-robin requests over.
         """
+        api_keys = normalize_api_keys(api_key)
+        if not api_keys:
+            raise ValueError("Anthropic API key is required.")
+        self.api_keys = api_keys
+        self.api_key = api_keys[0]
+        self._clients = [Anthropic(api_key=key, http_client=get_shared_sync_http_client(), max_retries=0) for key in api_keys]
+        self._aclients = [AsyncAnthropic(api_key=key, http_client=get_shared_http_client(), max_retries=0) for key in api_keys]
+        self._key_rotator = KeyRotator(len(api_keys))
+        # Clients for the first key, used for model listing and batch jobs
+        self.client = self._clients[0]
+        self.aclient = self._aclients[0]
+
+    def _build_message_kwargs(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the Messages API arguments shared by the sync and async paths."""
         model_name = options.get('model')
         if not model_name:
             raise ValueError("Missing required option 'model' for AnthropicProvider.")
@@ -41,6 +60,7 @@ class AnthropicProvider(BaseLLMProvider):
         # Prepare messages and system prompt for Anthropic
         system_prompt = None
         anthropic_messages = []
+        append = anthropic_messages.append
         for message in messages:
             role = message.get('role')
             content = message.get('content')
@@ -54,15 +74,22 @@ class AnthropicProvider(BaseLLMProvider):
                     system_prompt = content
                 # Skip adding system messages to the main messages list
                 continue
-            elif role == 'model':
-                # Map 'model' role to 'assistant'
-                anthropic_messages.append({"role": "assistant", "content": content})
-            elif role == 'user':
-                anthropic_messages.append({"role": "user", "content": content})
-            elif role == 'assistant':
-                anthropic_messages.append({"role": "assistant", "content": content})
-            else:
+
+            mapped_role = ANTHROPIC_ROLE_MAP.get(role)
+            if mapped_role is None:
                 raise ValueError(f"Unsupported role for Anthropic: {role}")
+            append({"role": mapped_role, "content": content})
+
+        # Cache the conversation up to the last user turn the model already answered, so the
+        # next request in this chat (which repeats that prefix) is read from Anthropic's prompt
+        # cache. Unanswered user turns, such as the panel context sent right before the
+        # question, are not repeated in later requests and are skipped.
+        for index in range(len(anthropic_messages) - 2, -1, -1):
+            message = anthropic_messages[index]
+            if message["role"] == "user" and anthropic_messages[index + 1]["role"] == "assistant":
+                if message["content"]:
+                    message["content"] = _with_cache_control(message["content"])
+                break
 
         # Prepare parameters
         max_tokens = options.get('max_tokens', DEFAULT_MAX_TOKENS)
@@ -73,53 +100,199 @@ class AnthropicProvider(BaseLLMProvider):
         }
         
         if system_prompt:
-            message_kwargs["system"] = system_prompt
+            # As a content block so the system prompt can be cached on its own as well
+            message_kwargs["system"] = [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL_EPHEMERAL_1H}]
         if 'temperature' in options:
             message_kwargs['temperature'] = options['temperature']
         if 'top_p' in options:
             message_kwargs['top_p'] = options['top_p']
         if 'top_k' in options:
             message_kwargs['top_k'] = options['top_k']
+        return message_kwargs
+
+    def _parse_message(self, response) -> str:
+        """Extracts the response text from a Messages API response."""
+        if response.content and len(response.content) > 0:
+            # Anthropic returns a list of content blocks; only text blocks carry a 'text' attribute
+            text_content = "".join(block.text for block in response.content if getattr(block, 'text', None))
+            return text_content.strip()
+        else:
+            raise ValueError("Anthropic API returned an empty response.")
 
+    def _map_error(self, error: Exception, index: Optional[int] = None, fallback: str = "Error communicating with Anthropic API") -> ValueError:
+        """
+        Converts an exception raised while calling the Anthropic API into the error raised to callers.
+
+        Args:
+            error: The exception raised by the SDK call (or while parsing its response).
+            index: Index of the API key used for the call; it is taken out of the rotation
+                   when the key was rate limited.
+            fallback: Prefix of the message for errors that are not mapped to a provider error.
+
+        Returns:
+            The exception to raise.
+        """
+        if isinstance(error, AuthenticationError):
+            return ProviderAuthenticationError("Invalid Anthropic API Key (Authentication failed).")
+        if isinstance(error, RateLimitError):
+            if index is not None:
+                self._key_rotator.mark_rate_limited(index)
+            return ProviderRateLimitError(f"Anthropic rate limit exceeded: {error}", retry_after=retry_after_seconds(error))
+        if isinstance(error, (APIConnectionError, InternalServerError, OverloadedError)):
+            return ProviderTransientError(f"Anthropic API temporarily unavailable: {error}")
+        if isinstance(error, APIError):
+            return ValueError(f"Anthropic API error: {error}")
+        return ValueError(f"{fallback}: {error}")
+
+    @cached_response
+    @retry_on_transient
+    def generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the Anthropic API.
+
+        Args:
+            messages: List of message dictionaries (must have 'role' and 'content').
+                      Roles 'user' and 'assistant' are expected. 'system' messages
+                      will be handled separately.
+            options: Dictionary of options, must include 'model'. Can also include
+                     'temperature', 'max_tokens', etc.
+
+        Returns:
+            A dictionary with the response text under 'response' and 'thought' set to None.
+
+        Raises:
+            ValueError: If required options are missing or API call fails.
+        """
+        message_kwargs = self._build_message_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
         try:
-            response = self.client.messages.create(**message_kwargs)
-            
-            # Extract content from response
-            if response.content and len(response.content) > 0:
-                # Anthropic returns a list of content blocks
-                text_content = ""
-                for content_block in response.content:
-                    if hasattr(content_block, 'text'):
-                        text_content += content_block.text
-                return text_content.strip()
-            else:
-                raise ValueError("Anthropic API returned an empty response.")
+            response = self._clients[index].messages.create(**message_kwargs)
+            return {'response': self._parse_message(response), 'thought': None}
+        except Exception as e:
+            raise self._map_error(e, index) from e
 
+    @cached_response
+    @retry_on_transient
+    async def agenerate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the async Anthropic client. See generate_response.
+        """
+        message_kwargs = self._build_message_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            response = await self._aclients[index].messages.create(**message_kwargs)
+            return {'response': self._parse_message(response), 'thought': None}
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    def stream_generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streams the response from the Anthropic API chunk by chunk as it is generated.
+        See generate_response for the arguments.
+        """
+        message_kwargs = self._build_message_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            with self._clients[index].messages.stream(**message_kwargs) as stream:
+                for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    async def astream_generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the response using the async Anthropic client. See stream_generate_response.
+        """
+        message_kwargs = self._build_message_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            async with self._aclients[index].messages.stream(**message_kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    def supports_batch(self) -> bool:
+        return True
+
+    def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        """
+        Submits the requests to the Anthropic Message Batches API.
+
+        Args:
+            requests: A list of dictionaries with 'messages' and 'options' keys.
+
+        Returns:
+            The Anthropic message batch ID.
+        """
+        batch_requests = [
+            {
+                "custom_id": str(i),
+                "params": self._build_message_kwargs(batch_request['messages'], batch_request.get('options', {})),
+            }
+            for i, batch_request in enumerate(requests)
+        ]
+
+        try:
+            batch = self.client.messages.batches.create(requests=batch_requests)
+            return batch.id
         except AuthenticationError:
-            raise ValueError("Invalid Anthropic API Key (Authentication failed).")
+            raise ProviderAuthenticationError("Invalid Anthropic API Key (Authentication failed).")
+        except APIError as e:
+            raise ValueError(f"Anthropic API error: {e}")
+
+    def fetch_batch(self, batch_id: str, poll_interval: float = 30, timeout: float = None) -> List[Optional[Dict[str, Optional[str]]]]:
+        """
+        Polls an Anthropic message batch until it ends and returns its results in submission order.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            while True:
+                batch = self.client.messages.batches.retrieve(batch_id)
+                if batch.processing_status == "ended":
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise ValueError(f"Timed out waiting for Anthropic batch {batch_id}.")
+                time.sleep(poll_interval)
+
+            counts = batch.request_counts
+            results = [None] * (counts.succeeded + counts.errored + counts.canceled + counts.expired)
+            for item in self.client.messages.batches.results(batch_id):
+                if item.result.type == "succeeded":
+                    results[int(item.custom_id)] = {'response': self._parse_message(item.result.message), 'thought': None}
+            return results
+        except AuthenticationError:
+            raise ProviderAuthenticationError("Invalid Anthropic API Key (Authentication failed).")
         except APIError as e:
             raise ValueError(f"Anthropic API error: {e}")
-        except Exception as e:
-            raise ValueError(f"Error communicating with Anthropic API: {e}")
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
         """
-        Validates an Anthropic API key by attempting to list models.
+        Validates an Anthropic API key. Malformed keys are rejected locally; otherwise a
+        single model is retrieved, which is much cheaper than listing all models.
         """
-        if not api_key:
+        if not api_key or not api_key.startswith(ANTHROPIC_KEY_PREFIX):
             return False
 
         try:
-            temp_client = Anthropic(api_key=api_key)
-            # Try to list models to validate the key
-            temp_client.models.list()
+            temp_client = Anthropic(api_key=api_key, http_client=get_shared_sync_http_client())
+            temp_client.models.retrieve(DEFAULT_ANTHROPIC_MODEL)
             return True
         except AuthenticationError:
             return False
+        except NotFoundError:
+            # The key was accepted, the model just isn't available to it
+            return True
         except Exception:
             return False
 
+    @ttl_cache(ttl=3600)
+    @retry_on_transient
     def get_models(self) -> List[Dict[str, str]]:
         """
         Fetches available models from Anthropic API.
@@ -132,13 +305,11 @@ class AnthropicProvider(BaseLLMProvider):
             
             models = []
             for model in models_response.data:
-                models.append({
-                    "label": getattr(model, 'display_name', model.id),
-                    "value": model.id
-                })
+                label = getattr(model, 'display_name', model.id)
+                models.append((label.lower(), {"label": label, "value": model.id}))
             
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
+            # Sort alphabetically on the precomputed lowercase labels
+            models.sort(key=itemgetter(0))
+            return [model for _, model in models]
         except Exception as e:
-            raise ValueError(f"Error fetching models from Anthropic: {e}")
\ No newline at end of file
+            raise self._map_error(e, fallback="Error fetching models from Anthropic") from e
@@ -1,6 +1,33 @@
 # llm_providers/base_provider.py
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, List, Optional
+
+class ProviderAuthenticationError(ValueError):
+    """
+    Raised when a provider rejects the API key (HTTP 401), so callers can report it
+    without validating the key up front.
+    """
+    pass
+
+class ProviderTransientError(ValueError):
+    """
+    Raised when a provider request failed for a reason that is likely to go away on a
+    retry (rate limiting, server errors, dropped connections).
+    Subclasses ValueError so existing error handling keeps treating it as a client error.
+
+    Attributes:
+        retry_after: Seconds the provider asked to wait before retrying (Retry-After), if given.
+    """
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ProviderRateLimitError(ProviderTransientError):
+    """
+    Raised when a provider rejects a request because of rate limiting (HTTP 429).
+    """
+    pass
 
 class BaseLLMProvider(ABC):
     """
@@ -8,7 +35,7 @@ class BaseLLMProvider(ABC):
     """
 
     @abstractmethod
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
         """
         Generates a response from the LLM based on the given messages.
 
@@ -19,7 +46,46 @@ class BaseLLMProvider(ABC):
             options: A dictionary of provider-specific options (e.g., temperature, max_tokens, model).
 
         Returns:
-            The LLM's response as a string. Raises an exception on error.
+            A dictionary {'response': text, 'thought': reasoning}, where 'thought' is None
+            unless the model returned its reasoning. Raises an exception on error.
+        """
+        pass
+
+    @abstractmethod
+    async def agenerate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Asynchronous counterpart of generate_response, backed by the provider's async client.
+        Lets callers run many requests concurrently on one event loop (e.g. with asyncio.gather).
+
+        Args:
+            messages: Same as generate_response.
+            options: Same as generate_response.
+
+        Returns:
+            A dictionary {'response': text, 'thought': reasoning}, where 'thought' is None
+            unless the model returned its reasoning. Raises an exception on error.
+        """
+        pass
+
+    @abstractmethod
+    def stream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streams the response from the LLM as it is generated, so callers can show the first
+        tokens early or stop consuming (and generating) part way through.
+
+        Args:
+            messages: Same as generate_response.
+            options: Same as generate_response.
+
+        Yields:
+            Chunks of the response text, in order. Raises an exception on error.
+        """
+        pass
+
+    @abstractmethod
+    def astream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Asynchronous counterpart of stream_generate_response; implemented as an async generator.
         """
         pass
 
@@ -37,6 +103,14 @@ class BaseLLMProvider(ABC):
         """
         pass
 
+    @classmethod
+    async def avalidate_api_key(cls, api_key: str) -> bool:
+        """
+        Async version of validate_api_key, so several keys can be checked concurrently.
+        Runs validate_api_key in a worker thread unless a provider overrides it.
+        """
+        return await asyncio.to_thread(cls.validate_api_key, api_key)
+
     @abstractmethod
     def get_models(self) -> List[Dict[str, str]]:
         """
@@ -45,4 +119,60 @@ class BaseLLMProvider(ABC):
         Returns:
             A list of model dictionaries with 'label' and 'value' keys.
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def abatch(self, messages_list: List[List[Dict[str, str]]], options: Dict[str, Any],
+                     max_concurrency: int = 10, rpm: int = None,
+                     on_progress: Callable[[int, int], None] = None) -> List[Dict[str, Optional[str]]]:
+        """
+        Generates responses for many conversations concurrently via agenerate_response.
+
+        Args:
+            messages_list: One message list per request.
+            options: Options shared by all requests.
+            max_concurrency: Maximum number of requests in flight at once.
+            rpm: Optional requests-per-minute limit.
+            on_progress: Optional callback invoked as on_progress(completed, total).
+
+        Returns:
+            The responses, in the same order as messages_list.
+        """
+        from .batch import BatchRunner  # Imported here to avoid a circular import
+        runner = BatchRunner(self, max_concurrency=max_concurrency, rate_limit_rpm=rpm, on_progress=on_progress)
+        return await runner.run(messages_list, options)
+
+    def supports_batch(self) -> bool:
+        """
+        Whether the provider offers a native (asynchronous, discounted) batch API.
+        Providers that do should override this together with submit_batch and fetch_batch.
+        """
+        return False
+
+    def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        """
+        Submits many requests as a single provider-side batch job.
+
+        Args:
+            requests: A list of dictionaries with 'messages' and 'options' keys, in the
+                      same format as the generate_response arguments.
+
+        Returns:
+            The provider's batch ID, to be passed to fetch_batch.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batch requests.")
+
+    def fetch_batch(self, batch_id: str, poll_interval: float = 30, timeout: float = None) -> List[Optional[Dict[str, Optional[str]]]]:
+        """
+        Waits for a batch job to finish and returns its results.
+
+        Args:
+            batch_id: The ID returned by submit_batch.
+            poll_interval: Seconds to wait between status checks.
+            timeout: Maximum seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            One {'response': text, 'thought': reasoning} dictionary per request, in the
+            order the requests were submitted, shaped like the result of generate_response.
+            Requests that failed on the provider side are returned as None.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batch requests.")
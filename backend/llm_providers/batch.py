@@ -0,0 +1,54 @@
+# llm_providers/batch.py
+import asyncio
+from aiolimiter import AsyncLimiter
+from .base_provider import BaseLLMProvider
+from typing import Callable, Dict, Any, List, Optional
+
+class BatchRunner:
+    """
+    Runs many agenerate_response calls concurrently, bounded by a concurrency limit
+    and an optional requests-per-minute token bucket. Rate-limited and other transient
+    failures are retried by the providers' agenerate_response (see retry.py).
+    """
+    def __init__(self, provider: BaseLLMProvider, max_concurrency: int = 10, rate_limit_rpm: int = None,
+                 on_progress: Callable[[int, int], None] = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.rate_limit_rpm = rate_limit_rpm
+        self.on_progress = on_progress
+
+    async def run(self, messages_list: List[List[Dict[str, str]]], options: Dict[str, Any]) -> List[Dict[str, Optional[str]]]:
+        """
+        Generates a response for every message list.
+
+        Args:
+            messages_list: One message list per request.
+            options: Options shared by all requests.
+
+        Returns:
+            The responses, in the same order as messages_list.
+
+        Raises:
+            ValueError: If a request fails, or is still failing transiently after all retries.
+        """
+        # Created per run so they are bound to the running event loop
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = AsyncLimiter(self.rate_limit_rpm, 60) if self.rate_limit_rpm else None
+        total = len(messages_list)
+        completed = 0
+
+        async def _one(messages: List[Dict[str, str]]):
+            nonlocal completed
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.acquire()
+                result = await self.provider.agenerate_response(messages, options)
+
+            completed += 1
+            if self.on_progress is not None:
+                self.on_progress(completed, total)
+            return result
+
+        return list(await asyncio.gather(*(_one(messages) for messages in messages_list)))
@@ -0,0 +1,262 @@
+# llm_providers/cache.py
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional
+from cachetools import TLRUCache, TTLCache
+
+try:
+    import orjson  # Optional, several times faster than json for hashing large message lists
+except ImportError:
+    orjson = None
+
+# Response cache constants
+DEFAULT_CACHE_MAXSIZE = 1024
+DEFAULT_CACHE_TTL = 3600  # seconds
+DEFAULT_RESPONSE_CACHE_TTL = 86400  # seconds, LLM responses are kept for a day
+# Requests up to this temperature are near-deterministic enough to be served from the cache
+MAX_CACHEABLE_TEMPERATURE = 0.2
+MODELS_CACHE_MAXSIZE = 64
+# Part of every response cache key; bump it when the shape of cached responses changes
+RESPONSE_CACHE_VERSION = 3
+# Options that only control caching and do not change the response
+CACHE_CONTROL_OPTIONS = frozenset({'cache', 'cache_ttl', 'context_cache'})
+
+
+def _json_default(value: Any) -> str:
+    """Makes non-JSON message parts (e.g. screenshot bytes) hashable."""
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.sha256(value).hexdigest()
+    return str(value)
+
+
+def _dumps_sorted(payload: Any) -> bytes:
+    """Serializes payload with sorted keys, as bytes ready for hashing."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, sort_keys=True, default=_json_default).encode()
+
+
+def response_cache_key(provider: str, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Optional[str]:
+    """
+    Builds the exact-match cache key for a request.
+
+    Args:
+        provider: Identity of the provider instance, including its credentials (see
+                  _provider_identity), so responses are never shared between keys or servers.
+        messages: The request messages.
+        options: The request options. All of them except CACHE_CONTROL_OPTIONS are part of the key.
+
+    Only requests that explicitly ask for (near-)deterministic sampling (a 'temperature'
+    option up to MAX_CACHEABLE_TEMPERATURE) are cacheable, unless the caller opted out
+    with the 'cache': False option; for anything else None is returned and the caller
+    should skip the cache. Without a temperature the provider samples at its own default
+    (usually 1.0), and a cached answer would be served where a fresh one is expected.
+    """
+    if not options.get('cache', True):
+        return None
+    try:
+        temperature = float(options['temperature'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if temperature > MAX_CACHEABLE_TEMPERATURE:
+        return None
+    payload = {
+        "version": RESPONSE_CACHE_VERSION,
+        "provider": provider,
+        "messages": messages,
+        # Every option that can change the output (model, sampling, stop sequences,
+        # provider pass-through options such as Ollama's seed or num_ctx)
+        "options": {key: value for key, value in options.items() if key not in CACHE_CONTROL_OPTIONS},
+    }
+    return hashlib.sha256(_dumps_sorted(payload)).hexdigest()
+
+
+class _RedisBackend:
+    """Stores cached responses in Redis so they are shared between workers."""
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed when LLM_CACHE_REDIS_URL is set
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: int):
+        self.client.set(key, json.dumps(value), ex=ttl)
+
+
+class _DiskBackend:
+    """Stores cached responses on disk so they survive restarts and are shared between worker processes."""
+    def __init__(self, directory: str):
+        import diskcache  # Only needed when LLM_CACHE_DIR is set
+        self.cache = diskcache.Cache(directory)
+
+    def get(self, key: str):
+        return self.cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: int):
+        self.cache.set(key, value, expire=ttl)
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache for LLM responses.
+
+    Backed by an in-process TTL cache by default, by Redis when a URL is given (or the
+    LLM_CACHE_REDIS_URL environment variable is set), or by a disk cache when a
+    directory is given (or LLM_CACHE_DIR is set).
+    """
+    def __init__(self, maxsize: int = DEFAULT_CACHE_MAXSIZE, redis_url: Optional[str] = None,
+                 cache_dir: Optional[str] = None):
+        redis_url = redis_url or os.getenv("LLM_CACHE_REDIS_URL")
+        cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR")
+        if redis_url:
+            self._backend = _RedisBackend(redis_url)
+        elif cache_dir:
+            self._backend = _DiskBackend(cache_dir)
+        else:
+            self._backend = None
+        # Entries are stored as (value, ttl) so every item can have its own expiry
+        self._local = TLRUCache(maxsize=maxsize, ttu=lambda _key, entry, now: now + entry[1])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """Returns the cached value for key, or None on a miss."""
+        if self._backend is not None:
+            value = self._backend.get(key)
+        else:
+            with self._lock:
+                entry = self._local.get(key)
+            value = entry[0] if entry is not None else None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: int = DEFAULT_RESPONSE_CACHE_TTL):
+        """Stores value under key for ttl seconds."""
+        if self._backend is not None:
+            self._backend.set(key, value, ttl)
+        else:
+            with self._lock:
+                self._local[key] = (value, ttl)
+
+    async def aget(self, key: str):
+        """Async version of get; Redis and disk lookups block, so they run in a worker thread."""
+        if self._backend is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: int = DEFAULT_RESPONSE_CACHE_TTL):
+        """Async version of set; Redis and disk writes run in a worker thread."""
+        if self._backend is None:
+            self.set(key, value, ttl)
+        else:
+            await asyncio.to_thread(self.set, key, value, ttl)
+
+    def clear(self):
+        """Drops all locally cached responses and resets the counters."""
+        with self._lock:
+            self._local.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by all providers
+response_cache = LLMResponseCache()
+
+
+def cached_response(method):
+    """
+    Decorator for generate_response / agenerate_response that serves deterministic
+    requests from the shared response cache.
+    """
+    def _lookup(self, messages, options):
+        key = response_cache_key(_provider_identity(self), messages, options)
+        cached = response_cache.get(key) if key is not None else None
+        return key, cached
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, messages, options):
+            key = response_cache_key(_provider_identity(self), messages, options)
+            if key is not None:
+                cached = await response_cache.aget(key)
+                if cached is not None:
+                    return cached
+            result = await method(self, messages, options)
+            if key is not None:
+                await response_cache.aset(key, result, ttl=options.get('cache_ttl', DEFAULT_RESPONSE_CACHE_TTL))
+            return result
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, messages, options):
+        key, cached = _lookup(self, messages, options)
+        if cached is not None:
+            return cached
+        result = method(self, messages, options)
+        if key is not None:
+            response_cache.set(key, result, ttl=options.get('cache_ttl', DEFAULT_RESPONSE_CACHE_TTL))
+        return result
+    return wrapper
+
+
+def _provider_identity(provider) -> str:
+    """
+    Identifies a provider instance by its class and credentials (API key(s), host or base URL).
+    The credentials are hashed so raw keys are never stored in cache keys.
+    """
+    credentials = "\0".join(str(getattr(provider, attr, None) or '')
+                            for attr in ('api_key', 'api_keys', 'base_url', 'host'))
+    return f"{type(provider).__name__}:{hashlib.blake2b(credentials.encode(), digest_size=16).hexdigest()}"
+
+
+def ttl_cache(ttl: int = DEFAULT_CACHE_TTL, maxsize: int = MODELS_CACHE_MAXSIZE):
+    """
+    Decorator that caches the result of an argument-less provider method (such as
+    get_models) per provider class and credentials for ttl seconds.
+
+    The wrapped method gains a cache_clear() function for manual invalidation,
+    e.g. after credentials change, and cache_invalidate(provider) to drop only the
+    entry of one provider instance.
+    """
+    def decorator(method):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        lock = threading.Lock()
+
+        @functools.wraps(method)
+        def wrapper(self):
+            key = _provider_identity(self)
+            with lock:
+                result = cache.get(key)
+            if result is None:
+                result = method(self)
+                with lock:
+                    cache[key] = result
+            # Return a copy so callers cannot modify the cached list
+            return list(result)
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        def cache_invalidate(provider):
+            with lock:
+                cache.pop(_provider_identity(provider), None)
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_invalidate = cache_invalidate
+        return wrapper
+    return decorator
+
@@ -1,7 +1,75 @@
 # llm_providers/gemini_provider.py
+import asyncio
+import datetime
+import functools
+import hashlib
+import threading
+import weakref
+from operator import itemgetter
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+from google.api_core.exceptions import DeadlineExceeded, InternalServerError, PermissionDenied, ResourceExhausted, ServiceUnavailable, Unauthenticated
+from .base_provider import BaseLLMProvider, ProviderAuthenticationError, ProviderRateLimitError, ProviderTransientError
+from .cache import cached_response, ttl_cache
+from .retry import retry_on_transient
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
+from cachetools import LRUCache, TTLCache
+
+# Gemini uses 'user' and 'model' roles
+GEMINI_ROLE_MAP = {"user": "user", "assistant": "model", "model": "model"}
+# Lifetime of the server-side context caches created for the 'context_cache' option
+CONTEXT_CACHE_TTL = 3600  # seconds
+# Stop using a context cache this long before the server expires it
+CONTEXT_CACHE_REFRESH_MARGIN = 60  # seconds
+CONTEXT_CACHE_MAXSIZE = 256
+# Number of API keys whose clients are kept alive between requests
+CLIENT_CACHE_SIZE = 128
+
+# Server-side context caches per (hashed API key, model name, system instruction), shared by
+# all provider instances since a new one is built for every request. None marks a cache
+# that could not be created, so the creation is not retried on every request.
+_context_caches: TTLCache = TTLCache(maxsize=CONTEXT_CACHE_MAXSIZE, ttl=CONTEXT_CACHE_TTL - CONTEXT_CACHE_REFRESH_MARGIN)
+_context_caches_lock = threading.Lock()
+
+# Async clients per event loop, then per API key: their gRPC channels are bound to the loop
+# they were created on
+_async_generative_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LRUCache]" = weakref.WeakKeyDictionary()
+
+
+# The clients are built per API key instead of through genai.configure, which sets the key
+# process-wide and so would let concurrent requests run under each other's keys.
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _generative_client(api_key: str) -> glm.GenerativeServiceClient:
+    """Returns the sync generation client for api_key, built once and reused by every provider instance."""
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _model_client(api_key: str) -> glm.ModelServiceClient:
+    """Returns the model listing client for api_key, built once and reused by every provider instance."""
+    return glm.ModelServiceClient(client_options={"api_key": api_key})
+
+
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _cache_client(api_key: str) -> glm.CacheServiceClient:
+    """Returns the context cache client for api_key, built once and reused by every provider instance."""
+    return glm.CacheServiceClient(client_options={"api_key": api_key})
+
+
+def _async_generative_client(api_key: str) -> glm.GenerativeServiceAsyncClient:
+    """Returns the async generation client for api_key on the running event loop."""
+    loop = asyncio.get_running_loop()
+    clients = _async_generative_clients.get(loop)
+    if clients is None:
+        # The channels of closed loops may keep their loop alive, so drop them explicitly
+        for closed_loop in [other for other in _async_generative_clients if other.is_closed()]:
+            del _async_generative_clients[closed_loop]
+        clients = _async_generative_clients[loop] = LRUCache(maxsize=CLIENT_CACHE_SIZE)
+    client = clients.get(api_key)
+    if client is None:
+        client = clients[api_key] = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return client
+
 
 class GeminiProvider(BaseLLMProvider):
     """
@@ -10,49 +78,177 @@ class GeminiProvider(BaseLLMProvider):
     def __init__(self, api_key: str):
         if not api_key:
             raise ValueError("Google API key is required.")
-        genai.configure(api_key=api_key)
         self.api_key = api_key
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    def _get_context_cached_model(self, model_name: str, system_instruction: str) -> Optional[genai.GenerativeModel]:
+        """
+        Returns a model backed by a server-side context cache holding system_instruction,
+        creating the cache on first use, so long system prompts are not re-billed every turn.
+
+        Returns None if the cache cannot be created (e.g. the model does not support caching
+        or the prompt is below its minimum cacheable size); this is remembered until the
+        cache would have expired so the creation is not retried on every request.
+
+        Creating the cache is a blocking network call; async callers use _aprepare_chat.
+        """
+        key = (hashlib.blake2b(self.api_key.encode(), digest_size=16).hexdigest(), model_name, system_instruction)
+        with _context_caches_lock:
+            cached = key in _context_caches
+            cached_content = _context_caches.get(key)
+        if not cached:
+            # Created outside the lock so other requests are not held up by the network call
+            try:
+                # CachedContent.create would use the SDK's process-wide client, so the request
+                # is sent through this key's cache client instead
+                request = genai.caching.CachedContent._prepare_create_request(
+                    model=model_name,
+                    system_instruction=system_instruction,
+                    ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+                )
+                cached_content = _cache_client(self.api_key).create_cached_content(request)
+            except Exception:
+                cached_content = None
+            with _context_caches_lock:
+                _context_caches[key] = cached_content
+        if cached_content is None:
+            return None
+        return genai.GenerativeModel.from_cached_content(cached_content)
+
+    def _prepare_chat(self, messages: List[Dict[str, Any]], options: Dict[str, Any]):
+        """
+        Splits the conversation in one pass into a system instruction, the chat history
+        and the final message to send, and starts a chat session with that history.
+
+        Messages may carry either a 'content' string or a Gemini 'parts' list. If the
+        'context_cache' option is set, the system instruction is served from a server-side
+        context cache where possible.
+
+        Returns:
+            A (chat session, parts of the final message) tuple.
+        """
+        system_texts = []
+        contents = []
+        for message in messages:
+            role = message.get('role', 'user')
+            parts = message.get('parts')
+            if parts is None:
+                parts = [message.get('content', '')]
+            if role == 'system':
+                system_texts.extend(part.get('text', '') if isinstance(part, dict) else part for part in parts)
+            else:
+                contents.append({"role": GEMINI_ROLE_MAP.get(role, 'user'), "parts": parts})
+
+        if not contents:
+            raise ValueError("At least one non-system message is required for Gemini.")
+
+        model_name = options.get('model', 'gemini-2.0-flash')
+        system_instruction = "\n".join(system_texts) or None
+        model = None
+        if system_instruction and options.get('context_cache'):
+            model = self._get_context_cached_model(model_name, system_instruction)
+        if model is None:
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        # Use this provider's key rather than the SDK's process-wide default client
+        model._client = _generative_client(self.api_key)
+        chat = model.start_chat(history=contents[:-1])
+        return chat, contents[-1]["parts"]
+
+    async def _aprepare_chat(self, messages: List[Dict[str, Any]], options: Dict[str, Any]):
+        """
+        Async counterpart of _prepare_chat. With the 'context_cache' option it runs in a
+        worker thread, since looking up the context cache may create it over the network.
+        """
+        if options.get('context_cache'):
+            chat, last_parts = await asyncio.to_thread(self._prepare_chat, messages, options)
+        else:
+            chat, last_parts = self._prepare_chat(messages, options)
+        # Picked here, on the event loop the client will be used from
+        chat.model._async_client = _async_generative_client(self.api_key)
+        return chat, last_parts
+
+    def _map_error(self, error: Exception, fallback: str = "Gemini API error") -> ValueError:
+        """
+        Converts an exception raised while calling the Gemini API into the error raised to callers.
+
+        Args:
+            error: The exception raised by the SDK call (or while parsing its response).
+            fallback: Prefix of the message for errors that are not mapped to a provider error.
+
+        Returns:
+            The exception to raise.
+        """
+        if isinstance(error, (Unauthenticated, PermissionDenied)):
+            return ProviderAuthenticationError("Invalid Google API Key (Authentication failed).")
+        if isinstance(error, ResourceExhausted):
+            return ProviderRateLimitError(f"Gemini rate limit exceeded: {error}")
+        if isinstance(error, (ServiceUnavailable, InternalServerError, DeadlineExceeded)):
+            return ProviderTransientError(f"Gemini API temporarily unavailable: {error}")
+        return ValueError(f"{fallback}: {error}")
+
+    @cached_response
+    @retry_on_transient
+    def generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
         """
         Generates a response using the Google Gemini API.
         
         Args:
-            messages: List of message dictionaries with 'role' and 'content' keys
+            messages: List of message dictionaries with 'role' and either 'content' or 'parts' keys.
+                      'system' messages are passed as the model's system instruction and the
+                      preceding turns as chat history.
             options: Dictionary of options including 'model', 'temperature', 'max_tokens', etc.
             
         Returns:
-            The LLM's response as a string
+            A dictionary with the response text under 'response' and the model's
+            reasoning under 'thought' (None if the model returned none)
             
         Raises:
             ValueError: If required options are missing or API call fails
         """
-        model_name = options.get('model', 'gemini-2.0-flash')
-        
         try:
-            model = genai.GenerativeModel(model_name)
-            
-            # Convert messages to Gemini format
-            # For now, concatenate all messages into a single prompt
-            # TODO: Implement proper conversation history handling
-            prompt_parts = []
-            for message in messages:
-                role = message.get('role', 'user')
-                content = message.get('content', '')
-                if role == 'system':
-                    prompt_parts.append(f"System: {content}")
-                elif role == 'user':
-                    prompt_parts.append(f"User: {content}")
-                elif role == 'assistant':
-                    prompt_parts.append(f"Assistant: {content}")
-            
-            full_prompt = "\n".join(prompt_parts)
-            
-            # Generate response
-            response = model.generate_content(full_prompt)
-            return response.text
+            chat, last_parts = self._prepare_chat(messages, options)
+            response = chat.send_message(last_parts)
+            return {'response': response.text, 'thought': None}
+        except Exception as e:
+            raise self._map_error(e) from e
+
+    @cached_response
+    @retry_on_transient
+    async def agenerate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the async Gemini API. See generate_response.
+        """
+        try:
+            chat, last_parts = await self._aprepare_chat(messages, options)
+            response = await chat.send_message_async(last_parts)
+            return {'response': response.text, 'thought': None}
+        except Exception as e:
+            raise self._map_error(e) from e
+
+    def stream_generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streams the response from the Gemini API chunk by chunk as it is generated.
+        See generate_response for the arguments.
+        """
+        try:
+            chat, last_parts = self._prepare_chat(messages, options)
+            for chunk in chat.send_message(last_parts, stream=True):
+                if chunk.parts:
+                    yield chunk.text
+        except Exception as e:
+            raise self._map_error(e) from e
+
+    async def astream_generate_response(self, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the response using the async Gemini API. See stream_generate_response.
+        """
+        try:
+            chat, last_parts = await self._aprepare_chat(messages, options)
+            response = await chat.send_message_async(last_parts, stream=True)
+            async for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
         except Exception as e:
-            raise ValueError(f"Gemini API error: {e}")
+            raise self._map_error(e) from e
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
@@ -60,12 +256,13 @@ class GeminiProvider(BaseLLMProvider):
         Validates a Google API key by making a simple request.
         """
         try:
-            genai.configure(api_key=api_key)
-            list(genai.list_models())  # Convert generator to list to trigger API call
+            list(_model_client(api_key).list_models())  # Convert pager to list to trigger API call
             return True
         except Exception:
             return False
 
+    @ttl_cache(ttl=3600)
+    @retry_on_transient
     def get_models(self) -> List[Dict[str, str]]:
         """
         Fetches available models from Google Gemini API.
@@ -74,21 +271,17 @@ class GeminiProvider(BaseLLMProvider):
             A list of model dictionaries with 'label' and 'value' keys.
         """
         try:
-            models_list = list(genai.list_models())
+            models_list = list(_model_client(self.api_key).list_models())
             
             models = []
             for model in models_list:
                 # Filter for models that support generateContent
-                if hasattr(model, 'supported_generation_methods') and \
-                   'generateContent' in model.supported_generation_methods:
+                if 'generateContent' in getattr(model, 'supported_generation_methods', ()):
                     display_name = getattr(model, 'display_name', model.name.split('/')[-1])
-                    models.append({
-                        "label": display_name,
-                        "value": model.name
-                    })
+                    models.append((display_name.lower(), {"label": display_name, "value": model.name}))
             
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
+            # Sort alphabetically on the precomputed lowercase labels
+            models.sort(key=itemgetter(0))
+            return [model for _, model in models]
         except Exception as e:
-            raise ValueError(f"Error fetching models from Google Gemini: {e}")
\ No newline at end of file
+            raise self._map_error(e, fallback="Error fetching models from Google Gemini") from e
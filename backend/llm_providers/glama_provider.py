@@ -1,94 +1,66 @@
 # llm_providers/glama_provider.py
 import os
-from openai import OpenAI, APIError, AuthenticationError
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+from openai import OpenAI, AsyncOpenAI, AuthenticationError
+from .http import get_shared_http_client, get_shared_sync_http_client
+from .key_rotation import normalize_api_keys
+from .openai_compat import OpenAICompatibleProvider
+from typing import List, Union
 
 # --- MODIFICATION START ---
 # Use the correct, working Glama API endpoint base URL
 DEFAULT_GLAMA_BASE_URL = "https://glama.ai/api/gateway/openai/v1"
 # --- MODIFICATION END ---
+# Resolved once at import; use GlamaProvider.set_base_url to change it at runtime
+_GLAMA_BASE_URL = os.getenv("GLAMA_API_BASE_URL", DEFAULT_GLAMA_BASE_URL)
 
-class GlamaProvider(BaseLLMProvider):
+class GlamaProvider(OpenAICompatibleProvider):
     """
     LLM provider implementation for Glama.ai using its OpenAI-compatible API.
     """
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        # Use environment variable for base URL if set, otherwise use the (now corrected) default
-        self.base_url = os.getenv("GLAMA_API_BASE_URL", DEFAULT_GLAMA_BASE_URL)
+    PROVIDER_NAME = "Glama"
+    API_ERROR_FORMAT = "Status={error.status_code}, Message={error.message}"
+    # Base URL used by new instances and by validate_api_key
+    _base_url = _GLAMA_BASE_URL
 
-    def _get_client(self) -> OpenAI:
-        """Creates an OpenAI client configured for Glama.ai."""
-        # This will now use the corrected self.base_url
-        return OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
+    def __init__(self, api_key: Union[str, List[str]]):
+        """
+        Args:
+            api_key: A Glama API key, or a list of keys to round-robin requests over.
+        """
+        api_keys = normalize_api_keys(api_key)
+        if not api_keys:
+            raise ValueError("Glama API key is required.")
+        self.api_keys = api_keys
+        self.api_key = api_keys[0]
+        # GLAMA_API_BASE_URL if it was set at import, otherwise the (now corrected) default
+        self.base_url = self._base_url
+        # Build the clients once so their connection pools are reused across calls
+        self._init_clients(
+            [OpenAI(api_key=key, base_url=self.base_url, http_client=get_shared_sync_http_client(), max_retries=0)
+             for key in api_keys],
+            [AsyncOpenAI(api_key=key, base_url=self.base_url, http_client=get_shared_http_client(), max_retries=0)
+             for key in api_keys],
         )
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    @classmethod
+    def set_base_url(cls, base_url: str):
         """
-        Generates a response using the Glama.ai API.
-        # ... (rest of the function remains the same) ...
+        Overrides the Glama API base URL for providers created afterwards and for key validation.
         """
-        client = self._get_client()
-        model_name = options.get('model')
-
-        if not model_name:
-            raise ValueError("Missing required option 'model' for GlamaProvider.")
-
-        completion_kwargs = {
-            "model": model_name,
-            "messages": messages,
-        }
-        if 'temperature' in options: completion_kwargs['temperature'] = options['temperature']
-        if 'max_tokens' in options: completion_kwargs['max_tokens'] = options['max_tokens']
-
-        try:
-            # This call should now go to the correct endpoint, e.g.,
-            # https://api.glama.ai/api/gateway/openai/v1/chat/completions
-            response = client.chat.completions.create(**completion_kwargs)
-            if response.choices:
-                message = response.choices[0].message
-                content = message.content.strip() if message.content else ''
-                
-                # Check for reasoning in JSON response
-                reasoning = None
-                if hasattr(message, 'reasoning') and message.reasoning:
-                    reasoning = message.reasoning
-                elif hasattr(message, 'reasoning_content') and message.reasoning_content:
-                    reasoning = message.reasoning_content
-                
-                # Return dict with thought if reasoning exists, otherwise just string
-                if reasoning:
-                    return {
-                        'thought': reasoning,
-                        'response': content
-                    }
-                else:
-                    return content
-            else:
-                raise ValueError("Glama API returned an empty response.")
-        except AuthenticationError:
-             # This error should hopefully not occur now with the correct base URL
-             raise ValueError("Invalid Glama API Key (Authentication failed).")
-        except APIError as e:
-            # More specific API errors (rate limits, bad requests post-auth)
-             raise ValueError(f"Glama API error: Status={e.status_code}, Message={e.message}")
-        except Exception as e:
-            raise ValueError(f"Error communicating with Glama API: {e}")
+        if not base_url:
+            raise ValueError("Glama base URL must not be empty.")
+        cls._base_url = base_url
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
         """
         Validates a Glama API key by attempting to list models.
         """
-        # This validation also needs to use the correct base URL
-        base_url_to_validate = os.getenv("GLAMA_API_BASE_URL", DEFAULT_GLAMA_BASE_URL)
         try:
             temp_client = OpenAI(
                 api_key=api_key,
-                base_url=base_url_to_validate, # Use the same (corrected) base URL
+                base_url=GlamaProvider._base_url, # Use the same (corrected) base URL
+                http_client=get_shared_sync_http_client(),
             )
             temp_client.models.list() # Check against the correct endpoint
             return True
@@ -97,27 +69,3 @@ class GlamaProvider(BaseLLMProvider):
         except Exception:
              # Network error, incorrect base URL, etc.
             return False
-
-    def get_models(self) -> List[Dict[str, str]]:
-        """
-        Fetches available models from Glama API.
-        
-        Returns:
-            A list of model dictionaries with 'label' and 'value' keys.
-        """
-        try:
-            client = self._get_client()
-            models_response = client.models.list()
-            
-            models = []
-            for model in models_response.data:
-                models.append({
-                    "label": model.id,
-                    "value": model.id
-                })
-            
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
-        except Exception as e:
-            raise ValueError(f"Error fetching models from Glama: {e}")
\ No newline at end of file
@@ -0,0 +1,92 @@
+# llm_providers/http.py
+import asyncio
+import threading
+import weakref
+
+try:
+    # Recent openai/anthropic SDKs are built on httpx2 and reject httpx objects
+    import httpx2 as sdk_httpx
+except ImportError:
+    import httpx as sdk_httpx
+
+# Connection pool settings shared by all provider clients
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 100
+KEEPALIVE_EXPIRY = 60  # seconds
+READ_TIMEOUT = 600.0  # seconds, same as the SDK defaults
+CONNECT_TIMEOUT = 10.0  # seconds
+
+HTTP_LIMITS = sdk_httpx.Limits(max_connections=MAX_CONNECTIONS,
+                               max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                               keepalive_expiry=KEEPALIVE_EXPIRY)
+HTTP_TIMEOUT = sdk_httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+_lock = threading.Lock()
+_shared_client = None
+_shared_sync_client = None
+
+
+class _LoopLocalAsyncClient(sdk_httpx.AsyncClient):
+    """
+    Async HTTP client that sends every request through a pooled client owned by the
+    running event loop.
+
+    An httpx.AsyncClient's connections are bound to the loop that opened them, so one
+    process-wide client breaks as soon as a second loop uses it (e.g. a script calling
+    asyncio.run for each batch). The SDK clients hold on to this object instead, and each
+    loop gets its own pool, dropped together with the loop.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._loop_clients_lock = threading.Lock()
+
+    def _client_for_running_loop(self) -> sdk_httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._loop_clients_lock:
+            client = self._loop_clients.get(loop)
+            if client is None:
+                # The pools of closed loops may keep their loop alive, so drop them explicitly
+                for closed_loop in [other for other in self._loop_clients if other.is_closed()]:
+                    del self._loop_clients[closed_loop]
+                client = sdk_httpx.AsyncClient(**self._client_kwargs)
+                self._loop_clients[loop] = client
+            return client
+
+    async def send(self, request, **kwargs):
+        return await self._client_for_running_loop().send(request, **kwargs)
+
+    async def aclose(self):
+        """Closes the running loop's pool."""
+        with self._loop_clients_lock:
+            client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def get_shared_http_client():
+    """
+    Returns the process-wide async HTTP client used by the async SDK clients.
+
+    HTTP/2 is enabled so concurrent requests to the same provider are multiplexed over
+    one connection where the endpoint supports it. The connection pool is kept per event
+    loop, so the client can be used from any loop (the server's, or one per asyncio.run
+    call in a script).
+    """
+    global _shared_client
+    with _lock:
+        if _shared_client is None:
+            _shared_client = _LoopLocalAsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=True)
+        return _shared_client
+
+
+def get_shared_sync_http_client():
+    """
+    Returns the process-wide HTTP client used by the sync SDK clients.
+    """
+    global _shared_sync_client
+    with _lock:
+        if _shared_sync_client is None:
+            _shared_sync_client = sdk_httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=True)
+        return _shared_sync_client
@@ -0,0 +1,45 @@
+# llm_providers/key_rotation.py
+import itertools
+import threading
+import time
+from typing import List, Union
+
+# Seconds a key is skipped after the provider rate-limited it
+DEFAULT_RATE_LIMIT_COOLDOWN = 30.0
+
+
+def normalize_api_keys(api_key: Union[str, List[str]]) -> List[str]:
+    """Returns the non-empty API key(s) as a list."""
+    keys = [api_key] if isinstance(api_key, str) else list(api_key or [])
+    return [key for key in keys if key]
+
+
+class KeyRotator:
+    """
+    Round-robins requests over several API keys so their rate limits add up.
+    Keys that were recently rate limited are skipped until their cool-down ends.
+    """
+    def __init__(self, size: int, cooldown: float = DEFAULT_RATE_LIMIT_COOLDOWN):
+        if size < 1:
+            raise ValueError("At least one API key is required.")
+        self.size = size
+        self.cooldown = cooldown
+        self._cycle = itertools.cycle(range(size))
+        self._cooldown_until = [0.0] * size
+        self._lock = threading.Lock()
+
+    def next_index(self) -> int:
+        """Returns the index of the key to use for the next request."""
+        with self._lock:
+            now = time.monotonic()
+            for _ in range(self.size):
+                index = next(self._cycle)
+                if self._cooldown_until[index] <= now:
+                    return index
+            # Every key is cooling down, use the one that becomes available first
+            return min(range(self.size), key=self._cooldown_until.__getitem__)
+
+    def mark_rate_limited(self, index: int):
+        """Takes the key at index out of the rotation for the cool-down period."""
+        with self._lock:
+            self._cooldown_until[index] = time.monotonic() + self.cooldown
@@ -1,8 +1,30 @@
 # llm_providers/ollama_provider.py
+import asyncio
 import os
+import threading
+import weakref
+from operator import itemgetter
+import httpx
 import ollama
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+import requests
+from .base_provider import BaseLLMProvider, ProviderRateLimitError, ProviderTransientError
+from .cache import cached_response, ttl_cache
+from .retry import retry_on_transient
+from .http import MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS, KEEPALIVE_EXPIRY, READ_TIMEOUT, CONNECT_TIMEOUT
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
+
+# The ollama clients are built on httpx, so use httpx versions of the shared pool settings
+OLLAMA_HTTP_LIMITS = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                  max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                                  keepalive_expiry=KEEPALIVE_EXPIRY)
+OLLAMA_HTTP_TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+# Timeout (in seconds) for the validate_connection liveness probe
+CONNECTION_CHECK_TIMEOUT = 2
+# Options that are handled separately, mapped, or not model options at all
+OLLAMA_RESERVED_OPTIONS = frozenset({'model', 'max_tokens', 'cache', 'cache_ttl'})
+
+# Server errors worth retrying (e.g. while a model is still loading)
+OLLAMA_TRANSIENT_STATUS_CODES = frozenset({500, 502, 503, 504})
 
 class OllamaProvider(BaseLLMProvider):
     """
@@ -12,7 +34,31 @@ class OllamaProvider(BaseLLMProvider):
         host = host or os.environ.get("OLLAMA_HOST")
         if not host:
             raise ValueError("OLLAMA_HOST environment variable or host parameter is required.")
-        self.client = ollama.Client(host=host)
+        self.host = host
+        # The ollama clients build their own httpx client, so pass the shared pool settings through
+        self.client = ollama.Client(host=host, limits=OLLAMA_HTTP_LIMITS, timeout=OLLAMA_HTTP_TIMEOUT)
+        self._loop_aclients = weakref.WeakKeyDictionary()
+        self._loop_aclients_lock = threading.Lock()
+
+    @property
+    def aclient(self) -> ollama.AsyncClient:
+        """
+        The async client for the running event loop.
+
+        Its httpx connections are bound to the loop that opened them, so each loop gets its
+        own client (as with the shared pool in http.py) instead of one that breaks once the
+        first loop is closed.
+        """
+        loop = asyncio.get_running_loop()
+        with self._loop_aclients_lock:
+            aclient = self._loop_aclients.get(loop)
+            if aclient is None:
+                # The clients of closed loops may keep their loop alive, so drop them explicitly
+                for closed_loop in [other for other in self._loop_aclients if other.is_closed()]:
+                    del self._loop_aclients[closed_loop]
+                aclient = ollama.AsyncClient(host=self.host, limits=OLLAMA_HTTP_LIMITS, timeout=OLLAMA_HTTP_TIMEOUT)
+                self._loop_aclients[loop] = aclient
+            return aclient
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
@@ -23,7 +69,53 @@ class OllamaProvider(BaseLLMProvider):
         """
         return bool(api_key and isinstance(api_key, str) and api_key.strip())
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    def _build_chat_kwargs(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the chat arguments shared by the sync and async paths."""
+        model_name = options.get('model')
+        if not model_name:
+            raise ValueError("Model is required for Ollama.")
+
+        # Pass every other option through to Ollama's model options.
+        # This is more flexible than hardcoding each parameter
+        ollama_options = {key: value for key, value in options.items() if key not in OLLAMA_RESERVED_OPTIONS}
+        if 'max_tokens' in options:
+            ollama_options['num_predict'] = options['max_tokens']
+
+        completion_kwargs = {
+            "model": model_name,
+            "messages": messages,
+            "options": ollama_options,
+        }
+        return completion_kwargs
+
+    def _parse_chat(self, response) -> Dict[str, Optional[str]]:
+        """Extracts the response text from an Ollama chat response."""
+        if response and 'message' in response and 'content' in response['message']:
+            return {'response': response['message']['content'].strip(), 'thought': None}
+        else:
+            raise ValueError("Ollama API returned an empty or invalid response.")
+
+    def _map_error(self, error: Exception, fallback: str = "Error communicating with Ollama API") -> ValueError:
+        """
+        Converts an exception raised while calling the Ollama API into the error raised to callers.
+
+        Args:
+            error: The exception raised by the client call (or while parsing its response).
+            fallback: Prefix of the message for errors that are not mapped to a provider error.
+
+        Returns:
+            The exception to raise.
+        """
+        if isinstance(error, ollama.ResponseError):
+            if error.status_code == 429:
+                return ProviderRateLimitError(f"Ollama rate limit exceeded: {error}")
+            if error.status_code in OLLAMA_TRANSIENT_STATUS_CODES:
+                return ProviderTransientError(f"Ollama server temporarily unavailable: {error}")
+        return ValueError(f"{fallback}: {error}")
+
+    @cached_response
+    @retry_on_transient
+    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
         """
         Generates a response using the Ollama API.
         
@@ -32,51 +124,81 @@ class OllamaProvider(BaseLLMProvider):
             options: Dictionary of options including 'model'
             
         Returns:
-            The LLM's response as a string
+            A dictionary with the response text under 'response' and the model's
+            reasoning under 'thought' (None if the model returned none)
             
         Raises:
             ValueError: If required options are missing or API call fails
         """
-        model_name = options.get('model')
-        if not model_name:
-            raise ValueError("Model is required for Ollama.")
+        completion_kwargs = self._build_chat_kwargs(messages, options)
 
-        completion_kwargs = {
-            "model": model_name,
-            "messages": messages,
-            "options": {}
-        }
-        
-        # Add optional parameters from the broader options dictionary
-        # This is more flexible than hardcoding each parameter
-        for key, value in options.items():
-            if key not in ['model', 'max_tokens']: # Already handled or mapped
-                completion_kwargs['options'][key] = value
+        try:
+            response = self.client.chat(**completion_kwargs)
+            return self._parse_chat(response)
+        except Exception as e:
+            raise self._map_error(e) from e
 
-        if 'max_tokens' in options:
-            completion_kwargs['options']['num_predict'] = options['max_tokens']
+    @cached_response
+    @retry_on_transient
+    async def agenerate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the async Ollama client. See generate_response.
+        """
+        completion_kwargs = self._build_chat_kwargs(messages, options)
 
         try:
-            response = self.client.chat(**completion_kwargs)
-            if response and 'message' in response and 'content' in response['message']:
-                return response['message']['content'].strip()
-            else:
-                raise ValueError("Ollama API returned an empty or invalid response.")
+            response = await self.aclient.chat(**completion_kwargs)
+            return self._parse_chat(response)
         except Exception as e:
-            raise ValueError(f"Error communicating with Ollama API: {e}")
+            raise self._map_error(e) from e
             
+    def stream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streams the response from the Ollama API chunk by chunk as it is generated.
+        See generate_response for the arguments.
+        """
+        completion_kwargs = self._build_chat_kwargs(messages, options)
+
+        try:
+            for chunk in self.client.chat(stream=True, **completion_kwargs):
+                content = chunk['message']['content']
+                if content:
+                    yield content
+        except Exception as e:
+            raise self._map_error(e) from e
+
+    async def astream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the response using the async Ollama client. See stream_generate_response.
+        """
+        completion_kwargs = self._build_chat_kwargs(messages, options)
+
+        try:
+            async for chunk in await self.aclient.chat(stream=True, **completion_kwargs):
+                content = chunk['message']['content']
+                if content:
+                    yield content
+        except Exception as e:
+            raise self._map_error(e) from e
+
     @staticmethod
     def validate_connection(host: str) -> bool:
         """
         Validates the connection to an Ollama host.
         """
+        if not host:
+            return False
+        if '://' not in host:
+            host = f"http://{host}"
         try:
-            client = ollama.Client(host=host)
-            client.list()
-            return True
+            # A bare GET against /api/tags is enough to check the server is up
+            response = requests.get(f"{host.rstrip('/')}/api/tags", timeout=CONNECTION_CHECK_TIMEOUT)
+            return response.status_code == 200
         except Exception:
             return False
 
+    @ttl_cache(ttl=3600)
+    @retry_on_transient
     def get_models(self) -> List[Dict[str, str]]:
         """
         Fetches available models from Ollama.
@@ -87,23 +209,17 @@ class OllamaProvider(BaseLLMProvider):
         try:
             models_response = self.client.list()
             
-            models = []
-            # The ollama client returns a ListResponse object with a 'models' attribute
+            # The ollama client returns a ListResponse object with a 'models' attribute,
+            # and each Model object has a 'model' attribute (not 'name')
             models_list = getattr(models_response, 'models', [])
-            
-            if models_list:
-                for model in models_list:
-                    # The Model object has a 'model' attribute (not 'name')
-                    model_name = getattr(model, 'model', None)
-                    
-                    if model_name:
-                        models.append({
-                            "label": model_name,
-                            "value": model_name
-                        })
-            
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
+            models = [
+                (model_name.lower(), {"label": model_name, "value": model_name})
+                for model in models_list
+                if (model_name := getattr(model, 'model', None))
+            ]
+
+            # Sort alphabetically on the precomputed lowercase labels
+            models.sort(key=itemgetter(0))
+            return [model for _, model in models]
         except Exception as e:
-            raise ValueError(f"Error fetching models from Ollama: {e}")
+            raise self._map_error(e, fallback="Error fetching models from Ollama") from e
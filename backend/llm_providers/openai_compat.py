@@ -0,0 +1,199 @@
+# llm_providers/openai_compat.py
+from operator import itemgetter
+from openai import APIError, AuthenticationError, APIConnectionError, InternalServerError, RateLimitError
+from .base_provider import BaseLLMProvider, ProviderAuthenticationError, ProviderRateLimitError, ProviderTransientError
+from .cache import cached_response, ttl_cache
+from .retry import retry_after_seconds, retry_on_transient
+from .key_rotation import KeyRotator
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
+
+
+class OpenAICompatibleProvider(BaseLLMProvider):
+    """
+    Base class for providers served through an OpenAI-compatible chat completions API
+    (OpenAI, xAI, Glama, vLLM).
+
+    Subclasses set PROVIDER_NAME and call _init_clients with one sync and one async
+    OpenAI client per API key. They only override what differs from the OpenAI API,
+    e.g. the accepted options (_build_completion_kwargs) or how the reply is parsed
+    (_parse_completion).
+    """
+    # Name used in error messages
+    PROVIDER_NAME = "OpenAI-compatible"
+    # Model used when the request does not name one, or None to require the 'model' option
+    DEFAULT_MODEL: Optional[str] = None
+    # Format of the message of API errors that are not mapped to a provider error
+    API_ERROR_FORMAT = "{error}"
+
+    def _init_clients(self, clients: List[Any], aclients: List[Any]):
+        """
+        Sets up the per-key clients and the key rotation over them.
+
+        Args:
+            clients: The sync clients, one per API key.
+            aclients: The async clients, in the same order.
+        """
+        self._clients = clients
+        self._aclients = aclients
+        self._key_rotator = KeyRotator(len(clients))
+        # Clients for the first key, used for model listing and batch jobs
+        self.client = clients[0]
+        self.aclient = aclients[0]
+
+    def _build_completion_kwargs(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the chat completion arguments shared by the sync and async paths."""
+        model_name = options.get('model', self.DEFAULT_MODEL)
+
+        if not model_name:
+            raise ValueError(f"Missing required option 'model' for {type(self).__name__}.")
+
+        completion_kwargs = {
+            "model": model_name,
+            "messages": messages,
+        }
+
+        # Add optional parameters
+        if 'temperature' in options:
+            completion_kwargs['temperature'] = options['temperature']
+        if 'max_tokens' in options:
+            completion_kwargs['max_tokens'] = options['max_tokens']
+        if 'top_p' in options:
+            completion_kwargs['top_p'] = options['top_p']
+        return completion_kwargs
+
+    def _parse_completion(self, response) -> Dict[str, Optional[str]]:
+        """Extracts the response text (and reasoning, if any) from a chat completion."""
+        if response.choices:
+            message = response.choices[0].message
+            content = message.content.strip() if message.content else ''
+
+            # Check for reasoning in JSON response (e.g., gpt-o1 models)
+            reasoning = getattr(message, 'reasoning', None) or getattr(message, 'reasoning_content', None)
+
+            return {'response': content, 'thought': reasoning or None}
+        else:
+            raise ValueError(f"{self.PROVIDER_NAME} API returned an empty response.")
+
+    def _map_error(self, error: Exception, index: Optional[int] = None, fallback: Optional[str] = None) -> ValueError:
+        """
+        Converts an exception raised while calling the API into the error raised to callers.
+
+        Args:
+            error: The exception raised by the SDK call (or while parsing its response).
+            index: Index of the API key used for the call; it is taken out of the rotation
+                   when the key was rate limited.
+            fallback: Prefix of the message for errors that are not mapped to a provider error.
+                      Defaults to "Error communicating with <provider> API".
+
+        Returns:
+            The exception to raise.
+        """
+        name = self.PROVIDER_NAME
+        if isinstance(error, AuthenticationError):
+            return ProviderAuthenticationError(f"Invalid {name} API Key (Authentication failed).")
+        if isinstance(error, RateLimitError):
+            if index is not None:
+                self._key_rotator.mark_rate_limited(index)
+            return ProviderRateLimitError(f"{name} rate limit exceeded: {error}", retry_after=retry_after_seconds(error))
+        if isinstance(error, (APIConnectionError, InternalServerError)):
+            return ProviderTransientError(f"{name} API temporarily unavailable: {error}")
+        if isinstance(error, APIError):
+            return ValueError(f"{name} API error: {self.API_ERROR_FORMAT.format(error=error)}")
+        return ValueError(f"{fallback or f'Error communicating with {name} API'}: {error}")
+
+    @cached_response
+    @retry_on_transient
+    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the provider's chat completions API.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content' keys
+            options: Dictionary of options including 'model', 'temperature', 'max_tokens', etc.
+
+        Returns:
+            A dictionary with the response text under 'response' and the model's
+            reasoning under 'thought' (None if the model returned none)
+
+        Raises:
+            ValueError: If required options are missing or API call fails
+        """
+        completion_kwargs = self._build_completion_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            response = self._clients[index].chat.completions.create(**completion_kwargs)
+            return self._parse_completion(response)
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    @cached_response
+    @retry_on_transient
+    async def agenerate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        Generates a response using the async client. See generate_response.
+        """
+        completion_kwargs = self._build_completion_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            response = await self._aclients[index].chat.completions.create(**completion_kwargs)
+            return self._parse_completion(response)
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    def stream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Iterator[str]:
+        """
+        Streams the response chunk by chunk as it is generated.
+        See generate_response for the arguments.
+        """
+        completion_kwargs = self._build_completion_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            with self._clients[index].chat.completions.create(stream=True, **completion_kwargs) as stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    async def astream_generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the response using the async client. See stream_generate_response.
+        """
+        completion_kwargs = self._build_completion_kwargs(messages, options)
+
+        index = self._key_rotator.next_index()
+        try:
+            stream = await self._aclients[index].chat.completions.create(stream=True, **completion_kwargs)
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise self._map_error(e, index) from e
+
+    @ttl_cache(ttl=3600)
+    @retry_on_transient
+    def get_models(self) -> List[Dict[str, str]]:
+        """
+        Fetches the available models from the provider's /models endpoint.
+
+        Returns:
+            A list of model dictionaries with 'label' and 'value' keys.
+        """
+        try:
+            models_response = self.client.models.list()
+
+            models = []
+            for model in models_response.data:
+                model_id = getattr(model, 'id', None)
+                if model_id:
+                    models.append((model_id.lower(), {"label": model_id, "value": model_id}))
+
+            # Sort alphabetically on the precomputed lowercase labels
+            models.sort(key=itemgetter(0))
+            return [model for _, model in models]
+        except Exception as e:
+            raise self._map_error(e, fallback=f"Error fetching models from {self.PROVIDER_NAME}") from e
@@ -1,110 +1,154 @@
 # llm_providers/openai_provider.py
-from openai import OpenAI, APIError, AuthenticationError
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+import io
+import json
+import time
+from openai import OpenAI, AsyncOpenAI, APIError, AuthenticationError, NotFoundError
+from openai.types.chat import ChatCompletion
+from .base_provider import ProviderAuthenticationError
+from .http import get_shared_http_client, get_shared_sync_http_client
+from .key_rotation import normalize_api_keys
+from .openai_compat import OpenAICompatibleProvider
+from typing import List, Dict, Any, Optional, Union
 
-class OpenAIProvider(BaseLLMProvider):
+# API key validation constants
+OPENAI_KEY_PREFIX = "sk-"
+OPENAI_KEY_MIN_LENGTH = 40
+VALIDATION_MODEL = "gpt-3.5-turbo"
+
+class OpenAIProvider(OpenAICompatibleProvider):
     """
     LLM provider implementation for OpenAI GPT models.
     """
-    def __init__(self, api_key: str):
-        if not api_key:
+    PROVIDER_NAME = "OpenAI"
+    DEFAULT_MODEL = "gpt-3.5-turbo"
+
+    def __init__(self, api_key: Union[str, List[str]]):
+        """
+        Args:
+            api_key: An OpenAI API key, or a list of keys to round-robin requests over.
+        """
+        api_keys = normalize_api_keys(api_key)
+        if not api_keys:
             raise ValueError("OpenAI API key is required.")
-        self.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
+        self.api_keys = api_keys
+        self.api_key = api_keys[0]
+        self._init_clients(
+            [OpenAI(api_key=key, http_client=get_shared_sync_http_client(), max_retries=0) for key in api_keys],
+            [AsyncOpenAI(api_key=key, http_client=get_shared_http_client(), max_retries=0) for key in api_keys],
+        )
+
+    def supports_batch(self) -> bool:
+        return True
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
         """
-        Generates a response using the OpenAI API.
-        
+        Submits the requests to the OpenAI Batch API (/v1/batches).
+
         Args:
-            messages: List of message dictionaries with 'role' and 'content' keys
-            options: Dictionary of options including 'model', 'temperature', 'max_tokens', etc.
-            
+            requests: A list of dictionaries with 'messages' and 'options' keys.
+
         Returns:
-            The LLM's response as a string
-            
-        Raises:
-            ValueError: If required options are missing or API call fails
+            The OpenAI batch ID.
         """
-        model_name = options.get('model', 'gpt-3.5-turbo')
+        lines = []
+        for i, batch_request in enumerate(requests):
+            body = self._build_completion_kwargs(batch_request['messages'], batch_request.get('options', {}))
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }))
 
-        completion_kwargs = {
-            "model": model_name,
-            "messages": messages,
-        }
-        
-        # Add optional parameters
-        if 'temperature' in options:
-            completion_kwargs['temperature'] = options['temperature']
-        if 'max_tokens' in options:
-            completion_kwargs['max_tokens'] = options['max_tokens']
-        if 'top_p' in options:
-            completion_kwargs['top_p'] = options['top_p']
+        try:
+            batch_file = self.client.files.create(
+                file=("batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+                purpose="batch",
+            )
+            batch = self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            return batch.id
+        except AuthenticationError:
+            raise ProviderAuthenticationError("Invalid OpenAI API Key (Authentication failed).")
+        except APIError as e:
+            raise ValueError(f"OpenAI API error: {e}")
 
+    def fetch_batch(self, batch_id: str, poll_interval: float = 30, timeout: float = None) -> List[Optional[Dict[str, Optional[str]]]]:
+        """
+        Polls an OpenAI batch until it completes and returns its results in submission order.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
         try:
-            response = self.client.chat.completions.create(**completion_kwargs)
-            if response.choices:
-                message = response.choices[0].message
-                content = message.content.strip() if message.content else ''
-                
-                # Check for reasoning in JSON response (e.g., gpt-o1 models)
-                reasoning = None
-                if hasattr(message, 'reasoning') and message.reasoning:
-                    reasoning = message.reasoning
-                elif hasattr(message, 'reasoning_content') and message.reasoning_content:
-                    reasoning = message.reasoning_content
-                
-                # Return dict with thought if reasoning exists, otherwise just string
-                if reasoning:
-                    return {
-                        'thought': reasoning,
-                        'response': content
-                    }
-                else:
-                    return content
-            else:
-                raise ValueError("OpenAI API returned an empty response.")
+            while True:
+                batch = self.client.batches.retrieve(batch_id)
+                if batch.status == "completed":
+                    break
+                if batch.status in ("failed", "expired", "cancelled"):
+                    raise ValueError(f"OpenAI batch {batch_id} finished with status '{batch.status}'.")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise ValueError(f"Timed out waiting for OpenAI batch {batch_id} (status '{batch.status}').")
+                time.sleep(poll_interval)
+
+            results = [None] * batch.request_counts.total
+            if batch.output_file_id:
+                output = self.client.files.content(batch.output_file_id).text
+                for line in output.splitlines():
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    response = item.get('response') or {}
+                    if response.get('status_code') != 200:
+                        continue
+                    body = response.get('body') or {}
+                    if body.get('choices'):
+                        # Parsed like a live completion, so reasoning is kept as well
+                        results[int(item['custom_id'])] = self._parse_completion(ChatCompletion.model_validate(body))
+            return results
         except AuthenticationError:
-            raise ValueError("Invalid OpenAI API Key (Authentication failed).")
+            raise ProviderAuthenticationError("Invalid OpenAI API Key (Authentication failed).")
         except APIError as e:
             raise ValueError(f"OpenAI API error: {e}")
-        except Exception as e:
-            raise ValueError(f"Error communicating with OpenAI API: {e}")
-            
+
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
         """
-        Validates an OpenAI API key by attempting to list models.
+        Validates an OpenAI API key. Malformed keys are rejected locally; otherwise a
+        single model is retrieved, which is much cheaper than listing all models.
         """
+        if not api_key or not api_key.startswith(OPENAI_KEY_PREFIX) or len(api_key) < OPENAI_KEY_MIN_LENGTH:
+            return False
+
         try:
-            temp_client = OpenAI(api_key=api_key)
-            temp_client.models.list()
+            temp_client = OpenAI(api_key=api_key, http_client=get_shared_sync_http_client())
+            temp_client.models.retrieve(VALIDATION_MODEL)
             return True
         except AuthenticationError:
             return False
+        except NotFoundError:
+            # The key was accepted, the model just isn't available to it
+            return True
         except Exception:
             return False
 
-    def get_models(self) -> List[Dict[str, str]]:
+    @staticmethod
+    async def avalidate_api_key(api_key: str) -> bool:
         """
-        Fetches available models from OpenAI API.
-        
-        Returns:
-            A list of model dictionaries with 'label' and 'value' keys.
+        Validates an OpenAI API key with the async client. See validate_api_key.
         """
+        if not api_key or not api_key.startswith(OPENAI_KEY_PREFIX) or len(api_key) < OPENAI_KEY_MIN_LENGTH:
+            return False
+
         try:
-            models_response = self.client.models.list()
-            
-            models = []
-            for model in models_response.data:
-                models.append({
-                    "label": model.id,
-                    "value": model.id
-                })
-            
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
-        except Exception as e:
-            raise ValueError(f"Error fetching models from OpenAI: {e}")
\ No newline at end of file
+            temp_client = AsyncOpenAI(api_key=api_key, http_client=get_shared_http_client())
+            await temp_client.models.retrieve(VALIDATION_MODEL)
+            return True
+        except AuthenticationError:
+            return False
+        except NotFoundError:
+            # The key was accepted, the model just isn't available to it
+            return True
+        except Exception:
+            return False
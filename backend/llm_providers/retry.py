@@ -0,0 +1,47 @@
+# llm_providers/retry.py
+from typing import Optional
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from .base_provider import ProviderTransientError
+
+# Retry constants for transient provider errors
+RETRY_MAX_ATTEMPTS = 5
+RETRY_INITIAL_WAIT = 1  # seconds
+RETRY_MAX_WAIT = 30  # seconds
+MAX_RETRY_AFTER = 60  # seconds, upper bound for a provider's Retry-After hint
+
+_exponential_wait = wait_exponential_jitter(initial=RETRY_INITIAL_WAIT, max=RETRY_MAX_WAIT)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Reads the Retry-After header of the HTTP response attached to an SDK error.
+
+    Returns:
+        The delay in seconds, or None if the header is missing or not a number of seconds.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    value = headers.get('retry-after') if headers is not None else None
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except (TypeError, ValueError):
+        # HTTP-date values are rare for LLM APIs, fall back to exponential backoff
+        return None
+
+
+def _wait(retry_state) -> float:
+    """Waits as long as the provider asked for, otherwise backs off exponentially with jitter."""
+    retry_after = getattr(retry_state.outcome.exception(), 'retry_after', None)
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    return _exponential_wait(retry_state)
+
+
+# Decorator for sync and async provider methods. Only ProviderTransientError is retried;
+# after the last attempt the original error is re-raised.
+retry_on_transient = retry(
+    retry=retry_if_exception_type(ProviderTransientError),
+    wait=_wait,
+    stop=stop_after_attempt(RETRY_MAX_ATTEMPTS),
+    reraise=True,
+)
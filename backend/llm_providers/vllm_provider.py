@@ -1,16 +1,22 @@
 # llm_providers/vllm_provider.py
 import os
 import requests
-from openai import OpenAI
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+from openai import OpenAI, AsyncOpenAI
+from .http import get_shared_http_client, get_shared_sync_http_client
+from .openai_compat import OpenAICompatibleProvider
+from typing import List, Dict, Any, Optional
 
+# Timeout (in seconds) for the validate_connection liveness probe
+CONNECTION_CHECK_TIMEOUT = 2
 
-class VLLMProvider(BaseLLMProvider):
+
+class VLLMProvider(OpenAICompatibleProvider):
     """
     LLM provider implementation for vLLM using its OpenAI-compatible API.
     vLLM provides an OpenAI-compatible server that can serve various open-source models.
     """
+    PROVIDER_NAME = "vLLM"
+
     def __init__(self, base_url: str, api_key: str = "EMPTY"):
         """
         Initialize the vLLM provider.
@@ -28,10 +34,19 @@ class VLLMProvider(BaseLLMProvider):
             
         self.base_url = base_url
         self.api_key = api_key or "EMPTY"
-        self.client = OpenAI(
+        client = OpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            http_client=get_shared_sync_http_client(),
+            max_retries=0,
+        )
+        aclient = AsyncOpenAI(
             base_url=self.base_url,
-            api_key=self.api_key
+            api_key=self.api_key,
+            http_client=get_shared_http_client(),
+            max_retries=0,
         )
+        self._init_clients([client], [aclient])
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
@@ -59,26 +74,18 @@ class VLLMProvider(BaseLLMProvider):
             if not base_url.endswith('/v1'):
                 base_url = base_url.rstrip('/') + '/v1'
                 
-            client = OpenAI(base_url=base_url, api_key=api_key or "EMPTY")
-            client.models.list()
-            return True
+            # A bare GET against /models is enough to check the server is up and accepts the key
+            response = requests.get(
+                f"{base_url}/models",
+                headers={"Authorization": f"Bearer {api_key or 'EMPTY'}"},
+                timeout=CONNECTION_CHECK_TIMEOUT,
+            )
+            return response.status_code == 200
         except Exception:
             return False
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
-        """
-        Generates a response using the vLLM API.
-        
-        Args:
-            messages: List of message dictionaries with 'role' and 'content' keys
-            options: Dictionary of options including 'model', 'temperature', 'max_tokens', etc.
-            
-        Returns:
-            The LLM's response as a string
-            
-        Raises:
-            ValueError: If required options are missing or API call fails
-        """
+    def _build_completion_kwargs(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the chat completion arguments shared by the sync and async paths."""
         model_name = options.get('model')
         if not model_name:
             raise ValueError("Model is required for vLLM.")
@@ -102,68 +109,26 @@ class VLLMProvider(BaseLLMProvider):
             completion_kwargs['presence_penalty'] = float(options['presence_penalty'])
         if 'stop' in options:
             completion_kwargs['stop'] = options['stop']
+        return completion_kwargs
 
-        try:
-            response = self.client.chat.completions.create(**completion_kwargs)
+    def _parse_completion(self, response) -> Dict[str, Optional[str]]:
+        """Extracts the response text and thought process (if any) from a chat completion."""
+        if response.choices and len(response.choices) > 0:
+            message = response.choices[0].message
+            content = message.content.strip() if message.content else ''
             
-            if response.choices and len(response.choices) > 0:
-                message = response.choices[0].message
-                content = message.content.strip() if message.content else ''
-                
-                # First, check for reasoning in JSON response fields (e.g., gpt-o1 style)
-                reasoning = None
-                if hasattr(message, 'reasoning') and message.reasoning:
-                    reasoning = message.reasoning
-                elif hasattr(message, 'reasoning_content') and message.reasoning_content:
-                    reasoning = message.reasoning_content
-                
-                # If JSON reasoning found, return it
-                if reasoning:
-                    return {
-                        'thought': reasoning,
-                        'response': content
-                    }
-                
-                # Otherwise, check if response contains thought process ending with </think>
-                if '</think>' in content:
-                    # Split by </think> tag
-                    parts = content.split('</think>', 1)
-                    thought_content = parts[0].strip()
-                    actual_response = parts[1].strip() if len(parts) > 1 else ''
-                    
-                    # Return as dictionary with both thought and response
-                    return {
-                        'thought': thought_content,
-                        'response': actual_response
-                    }
-                else:
-                    # No thought/reasoning found, return just the response
-                    return content
-            else:
-                raise ValueError("vLLM API returned an empty response.")
-        except Exception as e:
-            raise ValueError(f"Error communicating with vLLM API: {e}")
-
-    def get_models(self) -> List[Dict[str, str]]:
-        """
-        Fetches available models from the vLLM server.
-        
-        Returns:
-            A list of model dictionaries with 'label' and 'value' keys.
-        """
-        try:
-            models_response = self.client.models.list()
+            # First, check for reasoning in JSON response fields (e.g., gpt-o1 style)
+            reasoning = getattr(message, 'reasoning', None) or getattr(message, 'reasoning_content', None)
             
-            models = []
-            for model in models_response.data:
-                if hasattr(model, 'id') and model.id:
-                    models.append({
-                        "label": model.id,
-                        "value": model.id
-                    })
+            # If JSON reasoning found, return it
+            if reasoning:
+                return {'response': content, 'thought': reasoning}
             
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
-        except Exception as e:
-            raise ValueError(f"Error fetching models from vLLM: {e}")
+            # Otherwise, check if response contains thought process ending with </think>
+            thought_content, separator, actual_response = content.partition('</think>')
+            if separator:
+                return {'response': actual_response.strip(), 'thought': thought_content.strip()}
+            # No thought/reasoning found
+            return {'response': content, 'thought': None}
+        else:
+            raise ValueError("vLLM API returned an empty response.")
@@ -1,90 +1,48 @@
 # llm_providers/xai_provider.py
-from openai import OpenAI, APIError, AuthenticationError
-from .base_provider import BaseLLMProvider
-from typing import List, Dict, Any
+import functools
+from openai import OpenAI, AsyncOpenAI, AuthenticationError
+from .http import get_shared_http_client, get_shared_sync_http_client
+from .key_rotation import normalize_api_keys
+from .openai_compat import OpenAICompatibleProvider
+from typing import List, Union
 
 # xAI API Constants
 DEFAULT_XAI_BASE_URL = "https://api.x.ai/v1"
+# Number of API keys whose clients are kept alive between requests
+CLIENT_CACHE_SIZE = 128
 
-class XAIProvider(BaseLLMProvider):
+
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _client_for(api_key: str) -> OpenAI:
+    """Returns the sync xAI client for api_key, built once and reused by every provider instance."""
+    return OpenAI(api_key=api_key, base_url=DEFAULT_XAI_BASE_URL, http_client=get_shared_sync_http_client(), max_retries=0)
+
+
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _async_client_for(api_key: str) -> AsyncOpenAI:
+    """Returns the async xAI client for api_key, built once and reused by every provider instance."""
+    return AsyncOpenAI(api_key=api_key, base_url=DEFAULT_XAI_BASE_URL, http_client=get_shared_http_client(), max_retries=0)
+
+
+class XAIProvider(OpenAICompatibleProvider):
     """
     LLM provider implementation for xAI (Grok) using OpenAI-compatible API.
     """
-    def __init__(self, api_key: str):
-        if not api_key:
-            raise ValueError("xAI API key is required.")
-        self.api_key = api_key
-        self.base_url = DEFAULT_XAI_BASE_URL
-
-    def _get_client(self) -> OpenAI:
-        """Creates an OpenAI client configured for xAI API."""
-        return OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-        )
+    PROVIDER_NAME = "xAI"
+    API_ERROR_FORMAT = "Status={error.status_code}, Message={error.message}"
 
-    def generate_response(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    def __init__(self, api_key: Union[str, List[str]]):
         """
-        Generates a response using the xAI (Grok) API.
-        
         Args:
-            messages: List of message dictionaries with 'role' and 'content' keys
-            options: Dictionary of options including 'model', 'temperature', 'max_tokens', etc.
-            
-        Returns:
-            The LLM's response as a string
-            
-        Raises:
-            ValueError: If required options are missing or API call fails
+            api_key: An xAI API key, or a list of keys to round-robin requests over.
         """
-        client = self._get_client()
-        model_name = options.get('model')
-
-        if not model_name:
-            raise ValueError("Missing required option 'model' for XAIProvider.")
-
-        completion_kwargs = {
-            "model": model_name,
-            "messages": messages,
-        }
-        
-        # Add optional parameters
-        if 'temperature' in options:
-            completion_kwargs['temperature'] = options['temperature']
-        if 'max_tokens' in options:
-            completion_kwargs['max_tokens'] = options['max_tokens']
-        if 'top_p' in options:
-            completion_kwargs['top_p'] = options['top_p']
-
-        try:
-            response = client.chat.completions.create(**completion_kwargs)
-            if response.choices:
-                message = response.choices[0].message
-                content = message.content.strip() if message.content else ''
-                
-                # Check for reasoning in JSON response
-                reasoning = None
-                if hasattr(message, 'reasoning') and message.reasoning:
-                    reasoning = message.reasoning
-                elif hasattr(message, 'reasoning_content') and message.reasoning_content:
-                    reasoning = message.reasoning_content
-                
-                # Return dict with thought if reasoning exists, otherwise just string
-                if reasoning:
-                    return {
-                        'thought': reasoning,
-                        'response': content
-                    }
-                else:
-                    return content
-            else:
-                raise ValueError("xAI API returned an empty response.")
-        except AuthenticationError:
-            raise ValueError("Invalid xAI API Key (Authentication failed).")
-        except APIError as e:
-            raise ValueError(f"xAI API error: Status={e.status_code}, Message={e.message}")
-        except Exception as e:
-            raise ValueError(f"Error communicating with xAI API: {e}")
+        api_keys = normalize_api_keys(api_key)
+        if not api_keys:
+            raise ValueError("xAI API key is required.")
+        self.api_keys = api_keys
+        self.api_key = api_keys[0]
+        self.base_url = DEFAULT_XAI_BASE_URL
+        self._init_clients([_client_for(key) for key in api_keys], [_async_client_for(key) for key in api_keys])
 
     @staticmethod
     def validate_api_key(api_key: str) -> bool:
@@ -92,37 +50,22 @@ class XAIProvider(BaseLLMProvider):
         Validates an xAI API key by attempting to list models.
         """
         try:
-            temp_client = OpenAI(
-                api_key=api_key,
-                base_url=DEFAULT_XAI_BASE_URL,
-            )
-            temp_client.models.list()
+            _client_for(api_key).models.list()
             return True
         except AuthenticationError:
             return False
         except Exception:
             return False
 
-    def get_models(self) -> List[Dict[str, str]]:
+    @staticmethod
+    async def avalidate_api_key(api_key: str) -> bool:
         """
-        Fetches available models from xAI API.
-        
-        Returns:
-            A list of model dictionaries with 'label' and 'value' keys.
+        Validates an xAI API key with the async client. See validate_api_key.
         """
         try:
-            client = self._get_client()
-            models_response = client.models.list()
-            
-            models = []
-            for model in models_response.data:
-                models.append({
-                    "label": model.id,
-                    "value": model.id
-                })
-            
-            # Sort alphabetically
-            models.sort(key=lambda x: x["label"].lower())
-            return models
-        except Exception as e:
-            raise ValueError(f"Error fetching models from xAI: {e}")
\ No newline at end of file
+            await _async_client_for(api_key).models.list()
+            return True
+        except AuthenticationError:
+            return False
+        except Exception:
+            return False
@@ -1,8 +1,21 @@
 # backend.py
-from flask import Flask, request, jsonify
+import asyncio
+import functools
+from quart import Quart, Response, request, jsonify
 from dotenv import load_dotenv
+import hashlib
+from operator import itemgetter
 import os
-import requests
+import re
+import httpx
+import orjson
+from cachetools import TTLCache
+from quart.json.provider import DefaultJSONProvider
+
+# Load .env before importing the providers, some of them read settings at import time
+load_dotenv()
+
+from llm_providers.base_provider import ProviderAuthenticationError
 from llm_providers.gemini_provider import GeminiProvider
 from llm_providers.openai_provider import OpenAIProvider
 from llm_providers.xai_provider import XAIProvider  # Updated import
@@ -10,14 +23,22 @@ from llm_providers.anthropic_provider import AnthropicProvider
 from llm_providers.glama_provider import GlamaProvider
 from llm_providers.ollama_provider import OllamaProvider
 from llm_providers.vllm_provider import VLLMProvider
-from typing import Dict, Any, List # Import List
-from flask_cors import CORS
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Tuple
+from quart_cors import cors
 import base64
 
-app = Flask(__name__)
-CORS(app) # Enable CORS for all routes
 
-load_dotenv()
+class OrjsonProvider(DefaultJSONProvider):
+    """Parses request bodies and serializes responses with orjson instead of the stdlib json module."""
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
+app = cors(Quart(__name__), allow_origin="*") # Enable CORS for all routes
+app.json = OrjsonProvider(app)
 
 
 PROVIDER_ENV_VAR_MAP = {
@@ -30,116 +51,101 @@ PROVIDER_ENV_VAR_MAP = {
     "vLLM": "VLLM_BASE_URL",
 }
 
-PROVIDER_API_CONFIG = {
-    "Google": {
-        "url_template": "https://generativelanguage.googleapis.com/v1beta/models?key={api_key}",
-        "method": "GET",
-        "auth_type": "query_param", # Key goes in URL
-    },
-    "Anthropic": {
-        "url": "https://api.anthropic.com/v1/models",
-        "method": "GET",
-        "auth_type": "header",
-        "headers": {
-            "x-api-key": "{api_key}",
-            "anthropic-version": "2023-06-01", # Use a recent version
-            "Content-Type": "application/json",
-        }
-    },
-    "OpenAI": { # OpenAI
-        "url": "https://api.openai.com/v1/models",
-        "method": "GET",
-        "auth_type": "bearer", # Authorization: Bearer {api_key}
-    },
-    "xAI": { # xAI
-        "url": "https://api.x.ai/v1/models", # Updated to correct xAI URL
-        "method": "GET",
-        "auth_type": "bearer",
-    },
-     "Glama": {
-        "url": "https://glama.ai/api/gateway/openai/v1/models", # Glama's specific endpoint
-        "method": "GET",
-        "auth_type": "bearer",
-    },
+# Model-list endpoints used by the direct API fallback of /models
+GOOGLE_MODELS_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+ANTHROPIC_MODELS_URL = "https://api.anthropic.com/v1/models"
+OPENAI_MODELS_URL = "https://api.openai.com/v1/models"
+XAI_MODELS_URL = "https://api.x.ai/v1/models" # Updated to correct xAI URL
+GLAMA_MODELS_URL = "https://glama.ai/api/gateway/openai/v1/models" # Glama's specific endpoint
+ANTHROPIC_API_VERSION = "2023-06-01" # Use a recent version
+
+# Builds the (method, url, headers) of a provider's model-list request for an API key.
+# Splicing the key in directly avoids copying and formatting header templates per request.
+PROVIDER_REQUEST_BUILDERS = {
+    "Google": lambda api_key: ("GET", f"{GOOGLE_MODELS_URL}?key={api_key}", {}), # Key goes in URL
+    "Anthropic": lambda api_key: ("GET", ANTHROPIC_MODELS_URL, {
+        "x-api-key": api_key,
+        "anthropic-version": ANTHROPIC_API_VERSION,
+        "Content-Type": "application/json",
+    }),
+    "OpenAI": lambda api_key: ("GET", OPENAI_MODELS_URL, {"Authorization": f"Bearer {api_key}"}),
+    "xAI": lambda api_key: ("GET", XAI_MODELS_URL, {"Authorization": f"Bearer {api_key}"}),
+    "Glama": lambda api_key: ("GET", GLAMA_MODELS_URL, {"Authorization": f"Bearer {api_key}"}),
     # Add other providers if needed
 }
 
-def fetch_and_format_models(provider: str, api_key: str) -> List[Dict[str, str]]:
+# Pooled async client for the direct model-list requests, so repeated /models calls reuse
+# the TLS connection to each provider. Connection attempts are retried twice.
+MODELS_CONNECT_TIMEOUT = 3.05  # seconds
+MODELS_READ_TIMEOUT = 15  # seconds
+_MODELS_CLIENT = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    ),
+    timeout=httpx.Timeout(MODELS_READ_TIMEOUT, connect=MODELS_CONNECT_TIMEOUT),
+)
+
+# Formatted model lists per (provider, API key hash). Model lists change on the order of
+# hours to days, so /models is served from here unless the client asks for ?refresh=1.
+# Only touched from the event loop, so no lock is needed.
+MODELS_CACHE_TTL = 3600  # seconds
+_MODELS_CACHE = TTLCache(maxsize=256, ttl=MODELS_CACHE_TTL)
+
+
+@app.after_serving
+async def close_http_clients():
+    """Closes the pooled model-list client when the server shuts down."""
+    await _MODELS_CLIENT.aclose()
+
+
+async def fetch_and_format_models(provider: str, api_key: str) -> List[Dict[str, str]]:
     """Fetches models from the provider API and formats for Grafana Select."""
-    config = PROVIDER_API_CONFIG.get(provider)
-    if not config:
+    build_request = PROVIDER_REQUEST_BUILDERS.get(provider)
+    if not build_request:
         raise ValueError(f"Configuration not found for provider: {provider}")
-
-    url = config.get("url")
-    url_template = config.get("url_template")
-    headers = config.get("headers", {}).copy() # Copy to avoid modifying template
-    auth_type = config.get("auth_type")
-    method = config.get("method", "GET") # Default to GET
-
-    # Prepare URL and Headers based on auth type
-    request_url = url
-    if url_template:
-        request_url = url_template.format(api_key=api_key) # For query param auth
-
-    if auth_type == "bearer":
-        headers["Authorization"] = f"Bearer {api_key}"
-    elif auth_type == "header":
-        # Substitute api_key placeholder in headers
-        for key, value in headers.items():
-            if isinstance(value, str):
-                headers[key] = value.format(api_key=api_key)
-    elif auth_type != "query_param": # query_param handled in url_template
-         raise ValueError(f"Unsupported auth_type for {provider}: {auth_type}")
+    method, request_url, headers = build_request(api_key)
 
     # Make the request from the backend server
     try:
-        response = requests.request(method, request_url, headers=headers, timeout=15) # Added timeout
+        response = await _MODELS_CLIENT.request(method, request_url, headers=headers)
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
+        data = orjson.loads(response.content)
 
-        # Parse the response based on provider structure
-        models_data = []
+        # Parse the response based on provider structure into (lowercase label, label, value)
+        # tuples, so the labels are lowercased once rather than on every sort comparison
         if provider == "Google":
-            models_data = data.get("models", [])
             # Filter and map Google models
-            formatted_models = [
-                {
-                    "label": m.get("displayName", m.get("name", "").split('/')[-1]),
-                    "value": m.get("name")
-                }
-                for m in models_data
+            models = [
+                (label.lower(), label, m["name"])
+                for m in data.get("models", [])
                 if m.get("name") and "generateContent" in m.get("supportedGenerationMethods", [])
+                for label in (m.get("displayName") or m["name"].split('/')[-1],)
             ]
         elif provider == "Anthropic":
-            models_data = data.get("data", [])
             # Map Anthropic models
-            formatted_models = [
-                {
-                    "label": m.get("display_name", m.get("id")),
-                    "value": m.get("id")
-                }
-                for m in models_data if m.get("id")
+            models = [
+                (label.lower(), label, m["id"])
+                for m in data.get("data", []) if m.get("id")
+                for label in (m.get("display_name") or m["id"],)
             ]
         else: # OpenAI, Grok, DeepSeek, Glama (assume { data: [{ id: ... }] })
-            models_data = data.get("data", [])
-             # Map standard list models
-            formatted_models = [
-                {"label": m.get("id"), "value": m.get("id")}
-                for m in models_data if m.get("id")
-            ]
+            models = [(model_id.lower(), model_id, model_id) for m in data.get("data", []) if (model_id := m.get("id"))]
 
-        # Sort alphabetically by label
-        formatted_models.sort(key=lambda x: x.get("label", "").lower())
+        # Sort alphabetically on the precomputed lowercase labels
+        models.sort(key=itemgetter(0))
+        formatted_models = [{"label": label, "value": value} for _, label, value in models]
         return formatted_models
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
          raise ConnectionError(f"Timeout connecting to {provider} API at {request_url}")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         # Try to get more specific error from response if available
         error_detail = ""
         try:
-            if e.response is not None:
-                 error_detail = e.response.text[:500] # Limit error detail length
+            response = getattr(e, 'response', None) # Only set for HTTP status errors
+            if response is not None:
+                 error_detail = response.text[:500] # Limit error detail length
         except Exception:
             pass # Ignore errors during error handling
         raise ConnectionError(f"Error fetching models from {provider}: {e}. Detail: {error_detail}")
@@ -147,10 +153,10 @@ def fetch_and_format_models(provider: str, api_key: str) -> List[Dict[str, str]]
         raise ValueError(f"Error processing response from {provider}: {e}")
     
 @app.route('/models', methods=['POST'])
-def get_models():
+async def get_models():
     """Endpoint called by Grafana frontend to fetch models."""
     try:
-        data = request.get_json()
+        data = await request.get_json()
         if not data:
             return jsonify({"error": "Request body must be JSON"}), 400
 
@@ -169,18 +175,35 @@ def get_models():
         if not api_key:
             return jsonify({"error": f"Missing API Key for {provider}. Please provide it in the panel or set the {PROVIDER_ENV_VAR_MAP.get(provider)} environment variable."}), 400
 
-        # Try using provider's get_models method first (more reliable)
-        try:
-            provider_instance = create_llm_provider(provider, api_key)
-            models_list = provider_instance.get_models()
+        refresh = request.args.get('refresh') in ('1', 'true')
+        cache_key = (provider, _hash_api_key(api_key))
+        models_list = None if refresh else _MODELS_CACHE.get(cache_key)
+        if models_list is not None:
             return jsonify(models_list)
+
+        # Try using provider's get_models method first (more reliable). The key is not
+        # validated separately, the model listing itself fails with 401 for a bad key.
+        try:
+            provider_instance = build_llm_provider(provider, api_key)
+            if refresh:
+                provider_instance.get_models.cache_invalidate(provider_instance)
+            # The SDK model listing is blocking, keep it off the event loop
+            models_list = await asyncio.to_thread(provider_instance.get_models)
+        except ProviderAuthenticationError:
+            raise
         except Exception as provider_error:
             app.logger.warning(f"Provider method failed for {provider}: {provider_error}, falling back to API approach")
             
             # Fallback to direct API call approach
-            models_list = fetch_and_format_models(provider, api_key)
-            return jsonify(models_list)
+            if provider in MULTI_KEY_PROVIDERS:
+                api_key = next(iter(_split_api_keys(api_key)), api_key)
+            models_list = await fetch_and_format_models(provider, api_key)
+
+        _MODELS_CACHE[cache_key] = models_list
+        return jsonify(models_list)
 
+    except ProviderAuthenticationError as e:
+        return jsonify({"error": str(e)}), 401
     except (ValueError, ConnectionError) as e:
          # Handle known errors (bad provider, connection issues, API errors)
         app.logger.error(f"Error fetching models for {data.get('provider')}: {e}")
@@ -191,187 +214,333 @@ def get_models():
         return jsonify({"error": "An internal server error occurred while fetching models."}), 500
 
 
-def create_llm_provider(provider_name: str, api_key: str):
-    """Factory function to create LLM provider instances."""
-    if provider_name == "Google":
-        if not GeminiProvider.validate_api_key(api_key):
-            raise ValueError("Invalid Google API Key")
+# Providers whose API key field may hold several comma-separated keys to round-robin over
+MULTI_KEY_PROVIDERS = {"OpenAI", "xAI", "Anthropic", "Glama"}
+
+# Provider classes by the name the frontend sends
+PROVIDER_CLASSES = {
+    "Google": GeminiProvider,
+    "OpenAI": OpenAIProvider,
+    "xAI": XAIProvider,
+    "Anthropic": AnthropicProvider,
+    "Glama": GlamaProvider,
+    "Ollama": OllamaProvider,
+    "vLLM": VLLMProvider,
+}
+
+# Keys that passed validation recently, so they are not re-validated on every request.
+# Failed validations are not cached, they may have been caused by a network error.
+VALIDATION_CACHE_TTL = 300  # seconds
+_VALIDATION_CACHE = TTLCache(maxsize=1024, ttl=VALIDATION_CACHE_TTL)
+
+
+def _split_api_keys(api_key: str) -> List[str]:
+    """Splits a comma-separated API key field into the individual keys."""
+    return [key.strip() for key in api_key.split(',') if key.strip()]
+
+
+def _hash_api_key(api_key: str) -> str:
+    """Hashes an API key so raw keys are never stored in caches."""
+    return hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest()
+
+
+# Number of (provider, key) pairs whose provider instances are kept between requests
+PROVIDER_CACHE_SIZE = 512
+
+
+def build_llm_provider(provider_name: str, api_key: str):
+    """
+    Returns an LLM provider instance without validating the key. An invalid key
+    surfaces as ProviderAuthenticationError on the first request instead.
+
+    Instances are reused per (provider, key), so repeated requests skip the client
+    setup and share the key rotation state.
+    """
+    return _provider_cached(provider_name, api_key)
+
+
+@functools.lru_cache(maxsize=PROVIDER_CACHE_SIZE)
+def _provider_cached(provider_name: str, api_key: str):
+    """Builds the provider instance for (provider_name, api_key) once."""
+    return _new_llm_provider(provider_name, api_key)
+
+
+def _new_llm_provider(provider_name: str, api_key: str):
+    """Creates a new LLM provider instance."""
+    if provider_name in MULTI_KEY_PROVIDERS:
+        return PROVIDER_CLASSES[provider_name](_split_api_keys(api_key))
+    elif provider_name == "Google":
         return GeminiProvider(api_key)
-    elif provider_name == "OpenAI": # Assuming maps to OpenAIProvider
-        # Make sure OpenAIProvider exists and follows the pattern
-        if not OpenAIProvider.validate_api_key(api_key):
-            raise ValueError("Invalid OpenAI API Key")
-        return OpenAIProvider(api_key)
-    elif provider_name == "xAI":
-         # Make sure XAIProvider exists and follows the pattern
-        if not XAIProvider.validate_api_key(api_key):
-            raise ValueError("Invalid xAI API Key")
-        return XAIProvider(api_key)
-    elif provider_name == "Anthropic":
-         # Make sure AnthropicProvider exists and follows the pattern
-        if not AnthropicProvider.validate_api_key(api_key):
-            raise ValueError("Invalid Anthropic API Key")
-        return AnthropicProvider(api_key)
-    elif provider_name == "Glama": # <-- Add Glama case
-        if not GlamaProvider.validate_api_key(api_key):
-            raise ValueError("Invalid Glama API Key")
-        return GlamaProvider(api_key)
     elif provider_name == "Ollama":
-        if not OllamaProvider.validate_connection(api_key): # api_key is the host here
-            raise ValueError("Could not connect to Ollama host")
-        return OllamaProvider(host=api_key) # pass it as host
+        return OllamaProvider(host=api_key) # api_key is the host here
     elif provider_name == "vLLM":
-        if not VLLMProvider.validate_connection(api_key): # api_key is the base_url here
-            raise ValueError("Could not connect to vLLM server")
-        return VLLMProvider(base_url=api_key) # pass it as base_url
+        return VLLMProvider(base_url=api_key) # api_key is the base_url here
     else:
         raise ValueError(f"Unsupported LLM provider: {provider_name}")
 
+
+async def _avalidate_key(provider_name: str, api_key: str) -> bool:
+    """Validates a single key (or Ollama host / vLLM URL), using the validation cache."""
+    cache_key = (provider_name, _hash_api_key(api_key))
+    if cache_key in _VALIDATION_CACHE:
+        return True
+    if provider_name == "Ollama":
+        valid = await asyncio.to_thread(OllamaProvider.validate_connection, api_key)
+    elif provider_name == "vLLM":
+        valid = await asyncio.to_thread(VLLMProvider.validate_connection, api_key)
+    else:
+        valid = await PROVIDER_CLASSES[provider_name].avalidate_api_key(api_key)
+    if valid:
+        _VALIDATION_CACHE[cache_key] = True
+    return valid
+
+
+async def validate_all(keys: Dict[str, str]) -> Dict[str, bool]:
+    """
+    Validates the keys of several providers concurrently, so the total wait is the
+    slowest validation rather than the sum of all of them.
+
+    Args:
+        keys: Maps provider names to their API key (or comma-separated keys, Ollama host or vLLM URL).
+
+    Returns:
+        Maps each provider name to whether all of its keys are valid.
+
+    Raises:
+        ValueError: If a provider is not supported.
+    """
+    unsupported = [provider_name for provider_name in keys if provider_name not in PROVIDER_CLASSES]
+    if unsupported:
+        raise ValueError(f"Unsupported LLM provider(s): {', '.join(unsupported)}")
+
+    async def _validate_provider(provider_name: str, api_key: str) -> bool:
+        if not isinstance(api_key, str) or not api_key.strip():
+            return False
+        provider_keys = _split_api_keys(api_key) if provider_name in MULTI_KEY_PROVIDERS else [api_key]
+        try:
+            results = await asyncio.gather(*(_avalidate_key(provider_name, key) for key in provider_keys))
+        except Exception as e:
+            app.logger.warning(f"Key validation failed for {provider_name}: {e}")
+            return False
+        return all(results)
+
+    results = await asyncio.gather(*(_validate_provider(name, key) for name, key in keys.items()))
+    return dict(zip(keys, results))
+
+def _build_content_message(role: str, content: str, image_part: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Builds an OpenAI-style message. Screenshots are not forwarded to these providers yet."""
+    return {"role": role, "content": content}
+
+
+def _build_parts_message(role: str, content: str, image_part: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Builds a Gemini-style message, with the screenshot (if any) as an extra part."""
+    parts = [{"text": content}]
+    if image_part is not None:
+        parts.append(image_part)
+    return {"role": role, "parts": parts}
+
+
+def _attach_context_parts(message: Dict[str, Any], context: str) -> Dict[str, Any]:
+    """Puts the context in front of an OpenAI-style message as a separate text content part."""
+    return {**message, "content": [{"type": "text", "text": context}, {"type": "text", "text": message["content"]}]}
+
+
+def _attach_context_text(message: Dict[str, Any], context: str) -> Dict[str, Any]:
+    """Puts the context in front of the message's content, for APIs that only accept string content."""
+    return {**message, "content": f"{context}\n\n{message['content']}"}
+
+
+class ProviderProfile(NamedTuple):
+    """
+    How the frontend's messages are converted for one provider.
+
+    Attributes:
+        role_map: Maps frontend roles to provider roles.
+        fallback_role: Role used for roles missing from role_map, or None to keep them as they are.
+        builder: Builds a provider message from (role, content, image part or None).
+        context_attacher: Adds the panel context to the last message, or None to send the context
+                          as its own user message. Only providers whose API merges consecutive
+                          turns of the same role can take it as its own message; chat templates
+                          enforcing user/assistant alternation reject two user turns in a row.
+    """
+    role_map: Dict[str, str]
+    fallback_role: Optional[str]
+    builder: Callable[[str, str, Optional[Dict[str, Any]]], Dict[str, Any]]
+    context_attacher: Optional[Callable[[Dict[str, Any], str], Dict[str, Any]]]
+
+
+# OpenAI/Glama/xAI/vLLM use 'user', 'assistant' and 'system' and keep the frontend's roles
+OPENAI_PROFILE = ProviderProfile(role_map={}, fallback_role=None, builder=_build_content_message,
+                                 context_attacher=_attach_context_parts)
+# Ollama takes the same roles but only string content
+OLLAMA_PROFILE = ProviderProfile(role_map={}, fallback_role=None, builder=_build_content_message,
+                                 context_attacher=_attach_context_text)
+# Anthropic merges consecutive user turns, so the context can stay a separate, cacheable block
+ANTHROPIC_PROFILE = ProviderProfile(role_map={}, fallback_role=None, builder=_build_content_message,
+                                    context_attacher=None)
+# Gemini uses 'user' and 'model'. 'system' is kept so the provider can pass it as the
+# model's system instruction.
+GEMINI_PROFILE = ProviderProfile(role_map={'user': 'user', 'system': 'system'}, fallback_role='model',
+                                 builder=_build_parts_message, context_attacher=None)
+
+PROVIDER_PROFILES = {
+    "Google": GEMINI_PROFILE,
+    "OpenAI": OPENAI_PROFILE,
+    "xAI": OPENAI_PROFILE,
+    "Anthropic": ANTHROPIC_PROFILE,
+    "Glama": OPENAI_PROFILE,
+    "Ollama": OLLAMA_PROFILE,
+    "vLLM": OPENAI_PROFILE,
+}
+
+
+# Imperatives suggesting the request asks for an action (a COMMAND) rather than information;
+# their responses are neither served from nor stored in the response cache
+COMMAND_PATTERN = re.compile(r'\b(send|delete|create|update|post|run|execute|trigger)\b', re.IGNORECASE)
+
+
+def _is_cacheable(messages: List[Dict[str, Any]]) -> bool:
+    """
+    Classifies a chat request as informational (cacheable) or as a command (not cacheable).
+
+    Args:
+        messages: The messages as sent by the frontend.
+
+    Returns:
+        False if the conversation involves tool calls or the last user message contains an
+        imperative from COMMAND_PATTERN, True otherwise.
+    """
+    last_user_content = None
+    for message in messages:
+        if message.get('role') == 'tool' or message.get('tool_calls'):
+            return False
+        if message.get('role') == 'user':
+            last_user_content = message.get('content')
+    return not (isinstance(last_user_content, str) and COMMAND_PATTERN.search(last_user_content))
+
+
+def _prepare_chat_request(data: Dict[str, Any]) -> Tuple[str, str, List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Validates a /chat request body and converts its messages to the provider format.
+
+    Returns:
+        A (provider name, API key, prepared messages, options) tuple.
+
+    Raises:
+        ValueError: If the request is missing parameters or is malformed.
+    """
+    if not data:
+        raise ValueError("Request body must be JSON")
+    api_key = data.get('apiKey')
+    provider_name = data.get('llmProvider')
+    messages_input = data.get('messages') # Original messages from frontend
+    screenshot_base64 = data.get('screenshot')
+    # panel_data = data.get('panelData') # Keep if needed, maybe append to last message?
+    options = data.get('options', {}) # Includes model for Glama
+    ollama_args_str = data.get('ollamaArgs')
+
+    if provider_name == "Ollama" and ollama_args_str:
+        try:
+            # Parse comma-separated string into a dictionary
+            ollama_args = dict(arg.split(':', 1) for arg in ollama_args_str.split(','))
+            # Convert numeric strings to numbers
+            for key, value in ollama_args.items():
+                try:
+                    ollama_args[key] = float(value)
+                except (ValueError, TypeError):
+                    # Keep as string if conversion fails
+                    pass
+            # Merge with existing options, giving priority to ollama_args
+            options.update(ollama_args)
+        except Exception as e:
+            raise ValueError(f"Invalid format for Ollama Parameters: {e}")
+
+    if not provider_name or not messages_input:
+        raise ValueError("Missing required parameters (llmProvider, messages)")
+
+    # If API key is not provided in the request, try to get it from environment variables
+    if not api_key:
+        env_var_name = PROVIDER_ENV_VAR_MAP.get(provider_name)
+        if env_var_name:
+            api_key = os.getenv(env_var_name)
+
+    if not api_key:
+        raise ValueError(f"Missing API Key for {provider_name}. Please provide it in the panel or set the {PROVIDER_ENV_VAR_MAP.get(provider_name)} environment variable.")
+
+    # --- Centralized Message Preparation ---
+    # System messages go first (in their original order) so the prompt prefix is
+    # byte-identical across requests and can be served from the providers' prefix caches
+    messages_input = sorted(messages_input, key=lambda message: message.get('role') != 'system')
+
+    # Handle potential screenshot (currently only for Google Gemini)
+    image_part = None
+    if screenshot_base64 and provider_name == "Google":
+        # Strip the data URL header ("data:image/png;base64,") if present
+        header, separator, screenshot_data = screenshot_base64.partition(',')
+        if not separator:
+            screenshot_data = header
+        try:
+            # Restore any missing base64 padding
+            image_data = base64.b64decode(screenshot_data + '=' * (-len(screenshot_data) % 4))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Failed to decode screenshot: {e}")
+        image_part = {"mime_type": "image/png", "data": image_data}
+
+    for i, message in enumerate(messages_input):
+        if not message.get('role') or message.get('content') is None:
+            raise ValueError(f"Invalid message format at index {i}: {message}")
+
+    # Convert input messages to the target format (list of dicts) in one pass, using the
+    # provider's profile instead of branching on the provider for every message
+    role_map, fallback_role, builder, context_attacher = PROVIDER_PROFILES.get(provider_name, OPENAI_PROFILE)
+    # The screenshot is only attached to the last message
+    last_index = len(messages_input) - 1
+    prepared_messages: List[Dict[str, Any]] = [
+        builder(role_map.get(message['role'], fallback_role or message['role']), message['content'],
+                image_part if i == last_index else None)
+        for i, message in enumerate(messages_input)
+    ]
+
+
+    # --- Panel Data Handling ---
+    # The panel context goes before the question, as its own block where the provider allows it
+    # (see ProviderProfile.context_attacher), so the often large and unchanged context is not
+    # copied into the question string
+    panel_data = data.get('panelData')
+    if panel_data and prepared_messages:
+        context = f"--- Additional Context ---\n{panel_data}"
+        if context_attacher is not None:
+            prepared_messages[-1] = context_attacher(prepared_messages[-1], context)
+        else:
+            context_message = builder(role_map.get('user', fallback_role or 'user'), context, None)
+            prepared_messages.insert(len(prepared_messages) - 1, context_message)
+
+
+    # Check for Glama required option *before* creating provider
+    if provider_name == "Glama" and not options.get('model'):
+         raise ValueError("Missing 'model' in options for Glama provider")
+
+    return provider_name, api_key, prepared_messages, options
+
+
 @app.route('/chat', methods=['POST'])
-def chat():
+async def chat():
     try:
-        data = request.get_json()
-        api_key = data.get('apiKey')
-        provider_name = data.get('llmProvider')
-        messages_input = data.get('messages') # Original messages from frontend
-        screenshot_base64 = data.get('screenshot')
-        # panel_data = data.get('panelData') # Keep if needed, maybe append to last message?
-        options = data.get('options', {}) # Includes model for Glama
-        ollama_args_str = data.get('ollamaArgs')
-
-        if provider_name == "Ollama" and ollama_args_str:
-            try:
-                # Parse comma-separated string into a dictionary
-                ollama_args = dict(arg.split(':', 1) for arg in ollama_args_str.split(','))
-                # Convert numeric strings to numbers
-                for key, value in ollama_args.items():
-                    try:
-                        ollama_args[key] = float(value)
-                    except (ValueError, TypeError):
-                        # Keep as string if conversion fails
-                        pass
-                # Merge with existing options, giving priority to ollama_args
-                options.update(ollama_args)
-            except Exception as e:
-                return jsonify({"error": f"Invalid format for Ollama Parameters: {e}"}), 400
-
-        if not provider_name or not messages_input:
-            return jsonify({"error": "Missing required parameters (llmProvider, messages)"}), 400
+        data = await request.get_json()
+        provider_name, api_key, prepared_messages, options = _prepare_chat_request(data)
 
-        # If API key is not provided in the request, try to get it from environment variables
-        if not api_key:
-            env_var_name = PROVIDER_ENV_VAR_MAP.get(provider_name)
-            if env_var_name:
-                api_key = os.getenv(env_var_name)
+        if not _is_cacheable(data['messages']):
+            options['cache'] = False
 
-        if not api_key:
-            return jsonify({"error": f"Missing API Key for {provider_name}. Please provide it in the panel or set the {PROVIDER_ENV_VAR_MAP.get(provider_name)} environment variable."}), 400
-
-        # --- Centralized Message Preparation ---
-        prepared_messages: List[Dict[str, Any]] = []
-
-        # Handle potential screenshot (currently only for Google Gemini)
-        image_part = None
-        if screenshot_base64 and provider_name == "Google":
-            try:
-                # Ensure correct padding for base64
-                screenshot_data = screenshot_base64.split(',', 1)[1]
-                missing_padding = len(screenshot_data) % 4
-                if missing_padding:
-                    screenshot_data += '='* (4 - missing_padding)
-                image_data = base64.b64decode(screenshot_data)
-                image_part = {"mime_type": "image/png", "data": image_data}
-                # Note: Error handling for invalid base64 might be needed
-            except Exception as e:
-                 return jsonify({"error": f"Failed to decode screenshot: {e}"}), 400
-
-        # Convert input messages to the target format (list of dicts)
-        for i, message in enumerate(messages_input):
-            role = message.get('role')
-            content = message.get('content')
-
-            if not role or content is None:
-                 return jsonify({"error": f"Invalid message format at index {i}: {message}"}), 400
-
-            # Adjust roles if needed (e.g., Gemini specific adjustments)
-            if provider_name == "Google":
-                # Gemini uses 'user' and 'model'. Map 'system' to 'user'.
-                # The first message can often be 'system', treat it as 'user'.
-                # Subsequent system messages might need careful handling depending on context.
-                # Let's map system -> user for simplicity here.
-                 target_role = 'user' if role in ['user', 'system'] else 'model'
-            elif provider_name == "Glama" or provider_name == "OpenAI" or provider_name == "Ollama":
-                 # OpenAI/Glama/Ollama typically use 'user', 'assistant', 'system'
-                 # Keep roles as they are, assuming frontend sends compatible roles
-                 target_role = role
-            else:
-                 # Default behavior for other providers (Grok, Deepseek)
-                 # Assuming they can handle 'user', 'assistant', 'system' or adapt internally
-                 target_role = role
-
-
-            # Structure for the provider
-            message_dict = {"role": target_role}
-
-            # Add image part to the *last* message if it exists (Gemini logic)
-            if image_part and i == len(messages_input) - 1 and provider_name == "Google":
-                 message_dict["parts"] = [{"text": content}, image_part]
-            else:
-                 if provider_name == "Google":
-                     # Gemini needs parts structure
-                     message_dict["parts"] = [{"text": content}]
-                     # If image is present and it's the last message, add it
-                     if image_part and i == len(messages_input) - 1:
-                         message_dict["parts"].append(image_part)
-
-                 else:
-                     # Standard OpenAI/Glama format
-                     message_dict["content"] = content
-                     # Handle potential image for OpenAI compatible vision models later if needed
-
-            prepared_messages.append(message_dict)
-
-
-        # --- Panel Data Handling (Example: Append to last message content) ---
-        panel_data = data.get('panelData')
-        if panel_data and prepared_messages:
-            last_message = prepared_messages[-1]
-            context_appendix = f"\n\n--- Additional Context ---\n{panel_data}"
-            if 'parts' in last_message and isinstance(last_message['parts'], list): # Gemini format
-                 # Find the text part and append to it
-                 found_text = False
-                 for part in last_message['parts']:
-                     if 'text' in part:
-                         part['text'] += context_appendix
-                         found_text = True
-                         break
-                 if not found_text: # Should not happen if formatted correctly
-                     last_message['parts'].append({'text': context_appendix})
-            elif 'content' in last_message: # OpenAI/Glama format
-                last_message['content'] += context_appendix
-            # Else: Decide how to handle for other formats if necessary
-
-
-        # --- Provider Instantiation and Call ---
-        # Check for Glama required option *before* creating provider
-        if provider_name == "Glama" and not options.get('model'):
-             return jsonify({"error": "Missing 'model' in options for Glama provider"}), 400
-
-        llm_provider = create_llm_provider(provider_name, api_key)
-
-        # The `generate_response` method now expects the prepared_messages list
-        response_text = llm_provider.generate_response(prepared_messages, options)
-
-        # Handle response that may contain thought (from vLLM)
-        if isinstance(response_text, dict) and 'thought' in response_text:
-            print(f"Thought: {response_text.get('thought', '')}")
-            return jsonify({
-                "response": response_text.get('response', ''),
-                "thought": response_text.get('thought', '')
-            })
-        else:
-            return jsonify({"response": response_text})
+        # The key is not validated up front; a rejected key is reported as 401 below
+        llm_provider = build_llm_provider(provider_name, api_key)
+
+        # Every provider returns {'response': ..., 'thought': ...}, so the result is passed through as is
+        result = await llm_provider.agenerate_response(prepared_messages, options)
+        return jsonify(result)
 
+    except ProviderAuthenticationError as e:
+        return jsonify({"error": str(e)}), 401
     except ValueError as e:
         # Catch specific errors like invalid keys, missing options, API errors raised as ValueError
         return jsonify({"error": str(e)}), 400
@@ -382,5 +551,56 @@ def chat():
         return jsonify({"error": f"An internal server error occurred: {e}"}), 500
 
 
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    """
+    Same request body as /chat, but streams the response as server-sent events: one
+    `data: {"token": ...}` event per chunk, then `data: {"done": true}`. Errors raised
+    after the stream has started are sent as a `data: {"error": ...}` event.
+    """
+    try:
+        data = await request.get_json()
+        provider_name, api_key, prepared_messages, options = _prepare_chat_request(data)
+        llm_provider = build_llm_provider(provider_name, api_key)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async def events():
+        try:
+            async for token in llm_provider.astream_generate_response(prepared_messages, options):
+                yield f"data: {orjson.dumps({'token': token}).decode()}\n\n"
+            yield 'data: {"done": true}\n\n'
+        except ValueError as e:
+            yield f"data: {orjson.dumps({'error': str(e)}).decode()}\n\n"
+        except Exception as e:
+            app.logger.error(f"Unexpected error in /chat/stream: {e}", exc_info=True)
+            yield 'data: {"error": "An internal server error occurred."}\n\n'
+
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Long generations can outlast Quart's default response timeout
+    response.timeout = None
+    return response
+
+
+
+@app.route('/validate_keys', methods=['POST'])
+async def validate_keys():
+    """
+    Validates several providers' API keys at once, e.g. when a user pastes them all during
+    onboarding. Expects a JSON object mapping provider names to API keys and returns
+    the same providers mapped to true/false.
+    """
+    try:
+        data = await request.get_json()
+        if not data or not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object mapping providers to API keys"}), 400
+        return jsonify(await validate_all(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Unexpected error in /validate_keys: {e}", exc_info=True)
+        return jsonify({"error": "An internal server error occurred while validating keys."}), 500
+
 if __name__ == '__main__':
     app.run(debug=False, host="0.0.0.0", port=5000)
\ No newline at end of file